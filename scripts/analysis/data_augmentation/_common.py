@@ -0,0 +1,96 @@
+"""
+Label counting and density categories shared by the data augmentation scripts.
+"""
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+# A line made only of whitespace between two newlines
+BLANK_LINE_RE = re.compile(rb'\n[ \t\r\f\v]*\n')
+
+
+def count_label_lines(data):
+    """Count non-empty lines in the raw bytes of a label file."""
+    data = data.strip()
+    if not data:
+        return 0
+    if BLANK_LINE_RE.search(data):
+        # Rare case: blank lines inside the file, count them out exactly
+        return sum(1 for line in data.splitlines() if line.strip())
+    return data.count(b'\n') + 1
+
+
+def count_rocks_in_file(label_path):
+    """Count number of rocks in a single label file."""
+    with open(label_path, 'rb') as f:
+        return count_label_lines(f.read())
+
+
+def count_rocks_per_image(labels_dir):
+    """Count number of rocks in each label file."""
+    # One directory read, no Path objects per entry
+    with os.scandir(labels_dir) as it:
+        names = sorted(e.name for e in it if e.name.endswith('.txt'))
+    
+    # Reading many tiny files is syscall-bound, threads overlap the latency
+    paths = [os.path.join(labels_dir, name) for name in names]
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        counts = list(ex.map(count_rocks_in_file, paths))
+    
+    return {name[:-4]: count for name, count in zip(names, counts)}
+
+
+def _parse_yolo_lines(label_path, dtype):
+    """Tolerant line-by-line parse: short or non-numeric lines are skipped."""
+    rows = []
+    with open(label_path, 'r', errors='ignore') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            try:
+                rows.append([float(x) for x in parts[:5]])
+            except ValueError:
+                continue
+    return np.array(rows, dtype=dtype).reshape(-1, 5)
+
+
+def load_yolo_labels(label_path, dtype=np.float32):
+    """Load a YOLO label file as an (N, 5) array of class, cx, cy, w, h."""
+    try:
+        if os.stat(label_path).st_size == 0:
+            return np.empty((0, 5), dtype=dtype)
+    except FileNotFoundError:
+        return np.empty((0, 5), dtype=dtype)
+    
+    # Single C-level parse of the whole file, extra columns (e.g. score) are ignored.
+    # Malformed files fall back to the per-line parser, which skips the bad lines.
+    try:
+        return np.loadtxt(label_path, dtype=dtype, ndmin=2, usecols=range(5))
+    except ValueError:
+        return _parse_yolo_lines(label_path, dtype)
+
+
+CATEGORY_NAMES = ['empty', 'sparse', 'medium', 'dense']
+# Lower bounds of sparse (1-3 rocks), medium (4-10 rocks) and dense (11+ rocks)
+CATEGORY_BINS = [1, 4, 11]
+
+
+def categorize_images(rock_counts, counts_arr=None):
+    """Categorize images by number of rocks."""
+    if counts_arr is None:
+        counts_arr = np.fromiter(rock_counts.values(), dtype=np.int32, count=len(rock_counts))
+    
+    # 0 -> empty, 1 -> sparse, 2 -> medium, 3 -> dense
+    names = np.array(list(rock_counts.keys()))
+    cat_idx = np.digitize(counts_arr, CATEGORY_BINS)
+    
+    return {
+        name: names[cat_idx == i].tolist()
+        for i, name in enumerate(CATEGORY_NAMES)
+    }
@@ -4,52 +4,79 @@ Analyze the distribution of rocks per image in the training set.
 This helps us understand class imbalance and design augmentation strategy.
 """
 
+import argparse
 from pathlib import Path
+import matplotlib
+matplotlib.use('Agg')  # headless: figures are only saved to disk
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import numpy as np
-from collections import Counter
 
+from _common import count_rocks_per_image, categorize_images, load_yolo_labels
 
-def count_rocks_per_image(labels_dir):
-    """Count number of rocks in each label file."""
-    rock_counts = {}
-    
-    for label_file in sorted(labels_dir.glob("*.txt")):
-        with open(label_file, 'r') as f:
-            lines = [l.strip() for l in f.readlines() if l.strip()]
-            rock_counts[label_file.stem] = len(lines)
-    
-    return rock_counts
+plt.rcParams['figure.max_open_warning'] = 0
 
 
-def categorize_images(rock_counts):
-    """Categorize images by number of rocks."""
-    categories = {
-        'empty': [],      # 0 rocks
-        'sparse': [],     # 1-3 rocks
-        'medium': [],     # 4-10 rocks
-        'dense': []       # 11+ rocks
-    }
-    
-    for img_name, count in rock_counts.items():
-        if count == 0:
-            categories['empty'].append(img_name)
-        elif count <= 3:
-            categories['sparse'].append(img_name)
-        elif count <= 10:
-            categories['medium'].append(img_name)
-        else:
-            categories['dense'].append(img_name)
-    
-    return categories
+def labels_to_pixel_boxes(labels, img_w, img_h):
+    """Convert (N, 5) YOLO labels to (N, 4) pixel boxes as x_min, y_min, w, h."""
+    boxes = labels[:, 1:5] * np.array([img_w, img_h, img_w, img_h], dtype=labels.dtype)
+    boxes[:, :2] -= boxes[:, 2:] / 2
+    return boxes
+
+
+def add_box_outlines(ax, pixel_boxes, linewidth=2, color='red'):
+    """Draw (N, 4) x_min, y_min, w, h boxes on ax as a single LineCollection."""
+    x0, y0, w, h = pixel_boxes.T
+    x1, y1 = x0 + w, y0 + h
+    
+    # (N, 5, 2) closed outlines
+    verts = np.stack([
+        np.stack([x0, x1, x1, x0, x0], axis=1),
+        np.stack([y0, y0, y1, y1, y0], axis=1),
+    ], axis=2)
+    
+    ax.add_collection(LineCollection(verts, colors=color, linewidths=linewidth, rasterized=True),
+                      autolim=False)
+
+
+def load_display_image(img_path, max_size=512):
+    """
+    Read a (georeferenced) TIF as a displayable HxWx3 uint8 thumbnail.
+    Only a decimated version of at most max_size pixels per side is read from disk.
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+    
+    with rasterio.open(img_path) as src:
+        scale = min(1.0, max_size / max(src.width, src.height))
+        out_h = max(1, round(src.height * scale))
+        out_w = max(1, round(src.width * scale))
+        image = src.read(out_shape=(src.count, out_h, out_w), resampling=Resampling.bilinear)
+    
+    # Convert to displayable format
+    if image.shape[0] == 3:
+        image = np.transpose(image, (1, 2, 0))
+    elif image.shape[0] == 1:
+        image = image[0]
+        image = np.stack([image]*3, axis=-1)  # Convert to RGB
+    
+    # Normalize for display, in place on the freshly read buffer
+    if image.dtype == np.uint16:
+        # x / 65535 * 255 == x / 257, exact in integer arithmetic
+        np.floor_divide(image, 257, out=image)
+        image = image.astype(np.uint8)
+    elif image.dtype in [np.float32, np.float64]:
+        np.clip(image, 0, 1, out=image)
+        np.multiply(image, 255, out=image)
+        image = image.astype(np.uint8)
+    
+    return image
+
 
 def visualize_category_samples(categories, images_dir, labels_dir, output_dir):
     """
     Visualize one sample image from each category with bounding boxes.
     """
-    import rasterio
-    import cv2
-    from matplotlib.patches import Rectangle
     
     # Select one sample from each category
     samples = {}
@@ -82,21 +109,7 @@ def visualize_category_samples(categories, images_dir, labels_dir, output_dir):
         
         try:
             # Read image with rasterio (handles georeferenced TIFs)
-            with rasterio.open(img_path) as src:
-                image = src.read()
-                
-                # Convert to displayable format
-                if image.shape[0] == 3:
-                    image = np.transpose(image, (1, 2, 0))
-                elif image.shape[0] == 1:
-                    image = image[0]
-                    image = np.stack([image]*3, axis=-1)  # Convert to RGB
-                
-                # Normalize for display
-                if image.dtype == np.uint16:
-                    image = (image / 65535.0 * 255).astype(np.uint8)
-                elif image.dtype in [np.float32, np.float64]:
-                    image = (np.clip(image, 0, 1) * 255).astype(np.uint8)
+            image = load_display_image(img_path)
         except Exception as e:
             print(f"⚠️  Error loading {img_path}: {e}")
             ax.text(0.5, 0.5, f'Error loading\n{e}', ha='center', va='center')
@@ -106,36 +119,14 @@ def visualize_category_samples(categories, images_dir, labels_dir, output_dir):
         # Display image
         ax.imshow(image)
         
-        # Load and draw bounding boxes
-        label_path = labels_dir / f"{img_name}.txt"
-        n_boxes = 0
+        # Load and draw bounding boxes (YOLO format: class cx cy w h)
+        labels = load_yolo_labels(labels_dir / f"{img_name}.txt")
+        n_boxes = len(labels)
         
-        if label_path.exists():
-            with open(label_path, 'r') as f:
-                for line in f:
-                    parts = line.strip().split()
-                    if len(parts) >= 5:
-                        # YOLO format: class cx cy w h
-                        cx, cy, w, h = map(float, parts[1:5])
-                        
-                        # Convert normalized coords to pixels
-                        img_h, img_w = image.shape[:2]
-                        
-                        x_center = cx * img_w
-                        y_center = cy * img_h
-                        box_w = w * img_w
-                        box_h = h * img_h
-                        
-                        x_min = x_center - box_w / 2
-                        y_min = y_center - box_h / 2
-                        
-                        # Draw bounding box
-                        rect = Rectangle(
-                            (x_min, y_min), box_w, box_h,
-                            linewidth=2, edgecolor='red', facecolor='none'
-                        )
-                        ax.add_patch(rect)
-                        n_boxes += 1
+        # Convert normalized coords to pixels
+        img_h, img_w = image.shape[:2]
+        
+        add_box_outlines(ax, labels_to_pixel_boxes(labels, img_w, img_h), linewidth=2)
         
         # Color coding by category
         colors = {
@@ -155,6 +146,7 @@ def visualize_category_samples(categories, images_dir, labels_dir, output_dir):
     
     plt.tight_layout()
     plt.savefig(output_dir / "category_samples.png", dpi=150, bbox_inches='tight')
+    plt.close(fig)
     print(f"📊 Saved category samples to {output_dir}/category_samples.png")
     
     # Save individual images with more detail
@@ -169,19 +161,7 @@ def visualize_category_samples(categories, images_dir, labels_dir, output_dir):
             continue
         
         try:
-            with rasterio.open(img_path) as src:
-                image = src.read()
-                
-                if image.shape[0] == 3:
-                    image = np.transpose(image, (1, 2, 0))
-                elif image.shape[0] == 1:
-                    image = image[0]
-                    image = np.stack([image]*3, axis=-1)
-                
-                if image.dtype == np.uint16:
-                    image = (image / 65535.0 * 255).astype(np.uint8)
-                elif image.dtype in [np.float32, np.float64]:
-                    image = (np.clip(image, 0, 1) * 255).astype(np.uint8)
+            image = load_display_image(img_path)
         except Exception as e:
             print(f"⚠️  Error loading {img_path}: {e}")
             plt.close(fig_single)
@@ -189,31 +169,11 @@ def visualize_category_samples(categories, images_dir, labels_dir, output_dir):
         
         ax_single.imshow(image)
         
-        label_path = labels_dir / f"{img_name}.txt"
-        n_boxes = 0
+        labels = load_yolo_labels(labels_dir / f"{img_name}.txt")
+        n_boxes = len(labels)
         
-        if label_path.exists():
-            with open(label_path, 'r') as f:
-                for line in f:
-                    parts = line.strip().split()
-                    if len(parts) >= 5:
-                        cx, cy, w, h = map(float, parts[1:5])
-                        
-                        img_h, img_w = image.shape[:2]
-                        x_center = cx * img_w
-                        y_center = cy * img_h
-                        box_w = w * img_w
-                        box_h = h * img_h
-                        
-                        x_min = x_center - box_w / 2
-                        y_min = y_center - box_h / 2
-                        
-                        rect = Rectangle(
-                            (x_min, y_min), box_w, box_h,
-                            linewidth=3, edgecolor='red', facecolor='none'
-                        )
-                        ax_single.add_patch(rect)
-                        n_boxes += 1
+        img_h, img_w = image.shape[:2]
+        add_box_outlines(ax_single, labels_to_pixel_boxes(labels, img_w, img_h), linewidth=3)
         
         ax_single.set_title(
             f'Sample: {category.capitalize()} Category\n'
@@ -230,6 +190,11 @@ def visualize_category_samples(categories, images_dir, labels_dir, output_dir):
         plt.close(fig_single)
         
 def main():
+    parser = argparse.ArgumentParser(description="Analyze the distribution of rocks per training image.")
+    parser.add_argument("--no-visualize", action="store_true",
+                        help="Skip rendering one sample image per category")
+    args = parser.parse_args()
+    
     print("=" * 80)
     print("TRAINING SET DISTRIBUTION ANALYSIS")
     print("=" * 80)
@@ -247,14 +212,24 @@ def main():
     # Count rocks per image
     rock_counts = count_rocks_per_image(train_labels)
     
+    if not rock_counts:
+        print(f"❌ No label files found in {train_labels}")
+        return
+    
+    # One contiguous array reused for all statistics below
+    counts_arr = np.fromiter(rock_counts.values(), dtype=np.int32, count=len(rock_counts))
+    total_rocks = int(counts_arr.sum())
+    mean_rocks = counts_arr.mean()
+    median_rocks = np.median(counts_arr)
+    
     print(f"Total training images: {len(rock_counts)}")
-    print(f"Total rocks: {sum(rock_counts.values())}")
-    print(f"Average rocks per image: {np.mean(list(rock_counts.values())):.2f}")
-    print(f"Median rocks per image: {np.median(list(rock_counts.values())):.0f}")
+    print(f"Total rocks: {total_rocks}")
+    print(f"Average rocks per image: {mean_rocks:.2f}")
+    print(f"Median rocks per image: {median_rocks:.0f}")
     print()
     
     # Categorize
-    categories = categorize_images(rock_counts)
+    categories = categorize_images(rock_counts, counts_arr)
     
     print("=" * 80)
     print("DISTRIBUTION BY CATEGORY")
@@ -272,8 +247,9 @@ def main():
     
     # Histogram
     ax1 = axes[0]
-    counts = list(rock_counts.values())
-    ax1.hist(counts, bins=range(0, max(counts)+2), edgecolor='black', alpha=0.7)
+    # Counts are small integers: one counting pass instead of matplotlib's binning
+    hist = np.bincount(counts_arr)
+    ax1.bar(np.arange(hist.size), hist, width=1.0, align='edge', edgecolor='black', alpha=0.7)
     ax1.set_xlabel('Number of Rocks per Image')
     ax1.set_ylabel('Frequency')
     ax1.set_title('Distribution of Rocks per Image')
@@ -281,7 +257,7 @@ def main():
     
     # Bar plot by category
     ax2 = axes[1]
-    category_counts = [len(categories[cat]) for cat in ['empty', 'sparse', 'medium', 'dense']]
+    category_counts = [hist[0], hist[1:4].sum(), hist[4:11].sum(), hist[11:].sum()]
     
     ax2.bar(range(4), category_counts, 
             tick_label=['Empty\n(0)', 'Sparse\n(1-3)', 'Medium\n(4-10)', 'Dense\n(11+)'],
@@ -296,62 +272,71 @@ def main():
     output_dir.mkdir(parents=True, exist_ok=True)
     
     plt.savefig(output_dir / "training_distribution.png", dpi=150, bbox_inches='tight')
+    plt.close(fig)
     print(f"📊 Saved plot to {output_dir}/training_distribution.png")
     
     # Save detailed stats
-    with open(output_dir / "training_distribution.txt", 'w') as f:
-        f.write("TRAINING SET DISTRIBUTION ANALYSIS\n")
-        f.write("=" * 80 + "\n\n")
-        
-        f.write(f"Total images: {len(rock_counts)}\n")
-        f.write(f"Total rocks: {sum(rock_counts.values())}\n")
-        f.write(f"Mean rocks/image: {np.mean(list(rock_counts.values())):.2f}\n")
-        f.write(f"Median rocks/image: {np.median(list(rock_counts.values())):.0f}\n")
-        f.write(f"Min rocks/image: {min(rock_counts.values())}\n")
-        f.write(f"Max rocks/image: {max(rock_counts.values())}\n\n")
-        
-        f.write("DISTRIBUTION BY CATEGORY:\n")
-        f.write("-" * 80 + "\n")
-        for category, images in categories.items():
-            pct = len(images) / len(rock_counts) * 100
-            f.write(f"{category.capitalize():10s}: {len(images):4d} images ({pct:5.1f}%)\n")
-        
-        f.write("\n" + "=" * 80 + "\n")
-        f.write("AUGMENTATION RECOMMENDATIONS:\n")
-        f.write("=" * 80 + "\n\n")
-        
-        f.write("Approach A (Uniform Augmentation):\n")
-        f.write("  - Apply same augmentation to all images\n")
-        f.write("  - Standard YOLO augmentations during training\n\n")
-        
-        sparse_pct = len(categories['sparse']) / len(rock_counts) * 100
-        empty_pct = len(categories['empty']) / len(rock_counts) * 100
-        
-        f.write("Approach B (Targeted Augmentation):\n")
-        f.write(f"  - Empty images ({empty_pct:.1f}%): 3x augmentation (reduce false positives)\n")
-        f.write(f"  - Sparse images ({sparse_pct:.1f}%): 5x augmentation (hard cases)\n")
-        f.write(f"  - Medium images: 2x augmentation\n")
-        f.write(f"  - Dense images: No extra augmentation\n")
-        f.write("  - Helps balance learning across difficulty levels\n")
+    sparse_pct = len(categories['sparse']) / len(rock_counts) * 100
+    empty_pct = len(categories['empty']) / len(rock_counts) * 100
+    
+    lines = [
+        "TRAINING SET DISTRIBUTION ANALYSIS",
+        "=" * 80,
+        "",
+        f"Total images: {len(rock_counts)}",
+        f"Total rocks: {total_rocks}",
+        f"Mean rocks/image: {mean_rocks:.2f}",
+        f"Median rocks/image: {median_rocks:.0f}",
+        f"Min rocks/image: {counts_arr.min()}",
+        f"Max rocks/image: {counts_arr.max()}",
+        "",
+        "DISTRIBUTION BY CATEGORY:",
+        "-" * 80,
+    ]
+    for category, images in categories.items():
+        pct = len(images) / len(rock_counts) * 100
+        lines.append(f"{category.capitalize():10s}: {len(images):4d} images ({pct:5.1f}%)")
+    
+    lines += [
+        "",
+        "=" * 80,
+        "AUGMENTATION RECOMMENDATIONS:",
+        "=" * 80,
+        "",
+        "Approach A (Uniform Augmentation):",
+        "  - Apply same augmentation to all images",
+        "  - Standard YOLO augmentations during training",
+        "",
+        "Approach B (Targeted Augmentation):",
+        f"  - Empty images ({empty_pct:.1f}%): 3x augmentation (reduce false positives)",
+        f"  - Sparse images ({sparse_pct:.1f}%): 5x augmentation (hard cases)",
+        "  - Medium images: 2x augmentation",
+        "  - Dense images: No extra augmentation",
+        "  - Helps balance learning across difficulty levels",
+    ]
+    
+    # Built in memory and written in one go, no partial file on error
+    (output_dir / "training_distribution.txt").write_text("\n".join(lines) + "\n")
     
     print(f"📄 Saved detailed stats to {output_dir}/training_distribution.txt")
     
     print()
     
     # Visualize samples from each category
-    print("=" * 80)
-    print("VISUALIZING CATEGORY SAMPLES")
-    print("=" * 80)
-    print()
-    
-    images_dir = Path("data/swisstopo_data/images/train")
-    
-    if images_dir.exists():
-        visualize_category_samples(categories, images_dir, train_labels, output_dir)
-    else:
-        print(f"⚠️  Images directory not found: {images_dir}")
-    
-    print()
+    if not args.no_visualize:
+        print("=" * 80)
+        print("VISUALIZING CATEGORY SAMPLES")
+        print("=" * 80)
+        print()
+        
+        images_dir = Path("data/swisstopo_data/images/train")
+        
+        if images_dir.exists():
+            visualize_category_samples(categories, images_dir, train_labels, output_dir)
+        else:
+            print(f"⚠️  Images directory not found: {images_dir}")
+        
+        print()
 
     print("=" * 80)
     print("NEXT STEPS")
@@ -9,6 +9,8 @@ Strategy:
 - Dense images (11+ rocks): Keep as-is
 """
 
+import os
+from multiprocessing import get_context
 from pathlib import Path
 import shutil
 import cv2
@@ -16,18 +18,100 @@ import numpy as np
 import albumentations as A
 from tqdm import tqdm
 
+try:
+    import pyvips
+except ImportError:  # optional: SIMD-accelerated 8-bit decode/encode, OpenCV otherwise
+    pyvips = None
 
-def count_rocks(label_file):
-    """Count number of rocks in a label file."""
+from _common import count_rocks_per_image, categorize_images, load_yolo_labels
+
+
+# Number of augmented copies created per image, by rock density category
+AUG_FACTORS = {
+    'empty': 5,   # Augment negatives
+    'sparse': 5,  # 5x augmentation
+    'medium': 3,
+    'dense': 3,
+}
+
+
+def list_files(directory, suffix):
+    """Sorted names of files in directory ending with suffix (single scandir pass)."""
+    try:
+        with os.scandir(directory) as it:
+            return sorted(e.name for e in it if e.name.endswith(suffix) and e.is_file())
+    except FileNotFoundError:
+        return []
+
+
+def link_or_copy(src, dst):
+    """
+    Hardlink src to dst, falling back to a full copy (e.g. across filesystems).
+    Source files are never modified by this script, so sharing the inode is safe.
+    """
+    try:
+        os.unlink(dst)  # re-runs: never write through an existing link
+    except FileNotFoundError:
+        pass
     try:
-        with open(label_file, 'r') as f:
-            return len([l for l in f.readlines() if l.strip()])
-    except:
-        return 0
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def create_empty_file(path):
+    """Create (or truncate) an empty file with a bare open/close."""
+    fd = os.open(path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o644)
+    os.close(fd)
+
+
+def read_image(image_path):
+    """
+    Read an image as an HxWx3 uint8 array, or None if it cannot be read.
+    Channels stay in the backend's native order (RGB for pyvips, BGR for OpenCV);
+    write_image uses the same backend, so the round trip preserves colors.
+    """
+    if pyvips is not None:
+        try:
+            vimg = pyvips.Image.new_from_file(str(image_path), access='sequential')
+            if vimg.bands == 1:
+                vimg = vimg.bandjoin([vimg, vimg])
+            elif vimg.bands > 3:
+                vimg = vimg.extract_band(0, n=3)
+            if vimg.format != 'uchar':
+                vimg = vimg.cast('uchar', shift=True)  # 16-bit -> 8-bit like IMREAD_COLOR
+            return np.ndarray(buffer=vimg.write_to_memory(), dtype=np.uint8,
+                              shape=(vimg.height, vimg.width, 3))
+        except pyvips.Error:
+            return None
+    
+    return cv2.imread(str(image_path), cv2.IMREAD_COLOR)
+
+
+def write_image(output_path, image):
+    """Write an HxWx3 uint8 array from read_image, the format is picked from the file suffix."""
+    if pyvips is not None:
+        height, width = image.shape[:2]
+        vimg = pyvips.Image.new_from_memory(np.ascontiguousarray(image).data, width, height, 3, 'uchar')
+        vimg.write_to_file(str(output_path))
+    else:
+        cv2.imwrite(str(output_path), image)
 
 
-def get_augmentation_pipeline():
-    """Define safe augmentation pipeline using Albumentations with clipping."""
+def get_augmentation_pipeline(with_bboxes=True):
+    """
+    Define safe augmentation pipeline using Albumentations with clipping.
+    With with_bboxes=False the same transforms are built without bbox handling,
+    for images that have no boxes to carry along.
+    """
+    bbox_params = A.BboxParams(
+        format='yolo',
+        label_fields=['class_labels'],
+        min_visibility=0.1,   # Discard boxes where <10% remains visible
+        min_area=0.0,         # Keep all boxes (even tiny) unless filtered by visibility
+        clip=True             # ! THIS IS CRITICAL: clip boxes to [0,1]
+    ) if with_bboxes else None
+    
     return A.Compose([
         A.HorizontalFlip(p=0.7),
         A.VerticalFlip(p=0.7),
@@ -47,40 +131,45 @@ def get_augmentation_pipeline():
         A.RandomBrightnessContrast(brightness_limit=0.4, contrast_limit=0.4, p=0.5),
         A.HueSaturationValue(hue_shift_limit=12, sat_shift_limit=22, val_shift_limit=10, p=0.5),
     ],
-    bbox_params=A.BboxParams(
-        format='yolo',
-        label_fields=['class_labels'],
-        min_visibility=0.1,   # Discard boxes where <10% remains visible
-        min_area=0.0,         # Keep all boxes (even tiny) unless filtered by visibility
-        clip=True             # ! THIS IS CRITICAL: clip boxes to [0,1]
-    ))
+    is_check_shapes=False,  # single image input, nothing to cross-check per call
+    bbox_params=bbox_params)
 
 
-def augment_image_and_label(image_path, label_path, output_img_path, output_label_path, transform):
-    """Apply augmentation to image and update labels accordingly."""
+def augment_image_and_label(image_path, label_path, output_img_path, output_label_path, transform,
+                            transform_no_bbox=None):
+    """
+    Apply augmentation to image and update labels accordingly.
+    The image is written in the format given by output_img_path's suffix
+    (PNG for augmented copies: no georeferencing needed, much cheaper than LibTIFF).
+    
+    The image is augmented in its native channel order, without BGR<->RGB
+    conversions. Flips, noise, blur and brightness/contrast don't depend on
+    channel order. HueSaturationValue converts assuming RGB, so on BGR input
+    the hue shift is applied in a mirrored direction: still a valid random
+    color augmentation, just not the same draw as on RGB.
+    
+    Images without boxes go through transform_no_bbox when given, which skips
+    the bbox processing of the full pipeline.
+    """
     
     # Read image
-    image = cv2.imread(str(image_path))
+    image = read_image(image_path)
     if image is None:
         print(f"⚠️  Failed to read {image_path}")
         return False
     
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    
-    # Read labels
-    bboxes = []
-    class_labels = []
-    
-    if label_path.exists():
-        with open(label_path, 'r') as f:
-            for line in f:
-                parts = line.strip().split()
-                if len(parts) >= 5:
-                    class_labels.append(int(parts[0]))
-                    bboxes.append([float(x) for x in parts[1:5]])
-    
-    # Apply augmentation
     try:
+        # Read labels
+        labels = load_yolo_labels(label_path, dtype=np.float64)
+        class_labels = labels[:, 0].astype(np.int32).tolist()
+        bboxes = labels[:, 1:5].tolist()
+        
+        # Apply augmentation
+        if not bboxes and transform_no_bbox is not None:
+            write_image(output_img_path, transform_no_bbox(image=image)['image'])
+            create_empty_file(output_label_path)
+            return True
+        
         transformed = transform(image=image, bboxes=bboxes, class_labels=class_labels)
         
         aug_image = transformed['image']
@@ -88,13 +177,16 @@ def augment_image_and_label(image_path, label_path, output_img_path, output_labe
         aug_labels = transformed['class_labels']
         
         # Save augmented image
-        aug_image_bgr = cv2.cvtColor(aug_image, cv2.COLOR_RGB2BGR)
-        cv2.imwrite(str(output_img_path), aug_image_bgr)
+        write_image(output_img_path, aug_image)
         
-        # Save augmented labels
-        with open(output_label_path, 'w') as f:
-            for bbox, label in zip(aug_bboxes, aug_labels):
-                f.write(f"{label} {bbox[0]:.6f} {bbox[1]:.6f} {bbox[2]:.6f} {bbox[3]:.6f}\n")
+        # Save augmented labels (formatted in C, one row per box)
+        if len(aug_bboxes) == 0:
+            create_empty_file(output_label_path)
+        else:
+            rows = np.empty((len(aug_bboxes), 5), dtype=np.float64)
+            rows[:, 0] = aug_labels
+            rows[:, 1:] = np.asarray(aug_bboxes, dtype=np.float64)[:, :4]
+            np.savetxt(output_label_path, rows, fmt='%d %.6f %.6f %.6f %.6f')
         
         return True
     except Exception as e:
@@ -102,9 +194,47 @@ def augment_image_and_label(image_path, label_path, output_img_path, output_labe
         return False
 
 
-def main():
-    import os
+# Per-worker state, filled once by init_worker when the pool starts
+_WORKER = {}
+
+
+def init_worker():
+    """Build the augmentation pipelines once per worker process."""
+    _WORKER['transform'] = get_augmentation_pipeline()
+    _WORKER['transform_no_bbox'] = get_augmentation_pipeline(with_bboxes=False)
+
+
+def process_one(task):
+    """
+    Create all augmented copies of one training image.
+    Runs in a worker process, so it only takes picklable arguments.
+    """
+    img_file, label_file, dst_images, dst_labels, aug_factor, category = task
+    img_file = Path(img_file)
+    label_file = Path(label_file)
     
+    transform = _WORKER['transform']
+    transform_no_bbox = _WORKER['transform_no_bbox']
+    
+    n_augmented = 0
+    for aug_idx in range(aug_factor):
+        aug_img_name = f"{img_file.stem}_aug{aug_idx+1}.png"
+        aug_label_name = f"{img_file.stem}_aug{aug_idx+1}.txt"
+        
+        success = augment_image_and_label(
+            img_file, label_file,
+            Path(dst_images) / aug_img_name,
+            Path(dst_labels) / aug_label_name,
+            transform, transform_no_bbox
+        )
+        
+        if success:
+            n_augmented += 1
+    
+    return category, n_augmented
+
+
+def main():
     script_dir = Path(__file__).parent
     project_root = script_dir.parent.parent.parent
     os.chdir(project_root)
@@ -134,11 +264,19 @@ def main():
     dst_images_train.mkdir(parents=True, exist_ok=True)
     dst_labels_train.mkdir(parents=True, exist_ok=True)
     
-    # Get augmentation pipeline
-    transform = get_augmentation_pipeline()
-    
     # Process each image
-    image_files = sorted(src_images.glob("*.tif"))
+    image_files = [src_images / name for name in list_files(src_images, ".tif")]
+    
+    # Count and categorize all labels in one pass, no per-image label reads below
+    rock_counts = count_rocks_per_image(src_labels) if src_labels.exists() else {}
+    category_of = {
+        name: category
+        for category, names in categorize_images(rock_counts).items()
+        for name in names
+    }
+    
+    # Images without a label file get an empty one (negative sample)
+    missing = {f.stem for f in image_files} - rock_counts.keys()
     
     print(f"Processing {len(image_files)} training images...")
     print()
@@ -150,48 +288,38 @@ def main():
         'dense': {'original': 0, 'augmented': 0}
     }
     
-    for img_file in tqdm(image_files, desc="Augmenting"):
+    tasks = []
+    
+    for img_file in tqdm(image_files, desc="Copying originals"):
         label_file = src_labels / f"{img_file.stem}.txt"
         
-        rock_count = count_rocks(label_file)
-        
-        # Determine category and augmentation factor
-        if rock_count == 0:
-            category = 'empty'
-            aug_factor = 5  # Augment negatives
-        elif rock_count <= 3:
-            category = 'sparse'
-            aug_factor = 5  # 5x augmentation
-        elif rock_count <= 10:
-            category = 'medium'
-            aug_factor = 3  # 2x augmentation
-        else:
-            category = 'dense'
-            aug_factor = 3  # No augmentation
+        # Determine category and augmentation factor (no label file = empty)
+        category = category_of.get(img_file.stem, 'empty')
+        aug_factor = AUG_FACTORS[category]
         
         stats[category]['original'] += 1
         
         # Copy original
-        shutil.copy(img_file, dst_images_train / img_file.name)
-        if label_file.exists():
-            shutil.copy(label_file, dst_labels_train / f"{img_file.stem}.txt")
+        link_or_copy(img_file, dst_images_train / img_file.name)
+        if img_file.stem in missing:
+            create_empty_file(dst_labels_train / f"{img_file.stem}.txt")
         else:
-            (dst_labels_train / f"{img_file.stem}.txt").touch()
+            link_or_copy(label_file, dst_labels_train / f"{img_file.stem}.txt")
         
-        # Create augmentations
-        for aug_idx in range(aug_factor):
-            aug_img_name = f"{img_file.stem}_aug{aug_idx+1}{img_file.suffix}"
-            aug_label_name = f"{img_file.stem}_aug{aug_idx+1}.txt"
-            
-            success = augment_image_and_label(
-                img_file, label_file,
-                dst_images_train / aug_img_name,
-                dst_labels_train / aug_label_name,
-                transform
-            )
-            
-            if success:
-                stats[category]['augmented'] += 1
+        if aug_factor > 0:
+            tasks.append((
+                str(img_file), str(label_file),
+                str(dst_images_train), str(dst_labels_train),
+                aug_factor, category
+            ))
+    
+    # Create augmentations, one task per image spread over all cores
+    with get_context('spawn').Pool(os.cpu_count(), initializer=init_worker) as pool:
+        for category, n_augmented in tqdm(
+            pool.imap_unordered(process_one, tasks, chunksize=8),
+            total=len(tasks), desc="Augmenting"
+        ):
+            stats[category]['augmented'] += n_augmented
     
     # Copy val and test sets (no augmentation)
     print("\nCopying validation and test sets...")
@@ -206,27 +334,32 @@ def main():
         dst_lbl_split.mkdir(parents=True, exist_ok=True)
         
         if src_img_split.exists():
+            split_images = [src_img_split / name for name in list_files(src_img_split, ".tif")]
+            split_label_stems = {name[:-4] for name in list_files(src_lbl_split, ".txt")}
+            split_missing = {img.stem for img in split_images} - split_label_stems
+            
             count = 0
-            for img in src_img_split.glob("*.tif"):
-                shutil.copy(img, dst_img_split / img.name)
+            for img in split_images:
+                link_or_copy(img, dst_img_split / img.name)
                 
-                label = src_lbl_split / f"{img.stem}.txt"
-                if label.exists():
-                    shutil.copy(label, dst_lbl_split / label.name)
+                if img.stem in split_missing:
+                    create_empty_file(dst_lbl_split / f"{img.stem}.txt")
                 else:
-                    (dst_lbl_split / f"{img.stem}.txt").touch()
+                    link_or_copy(src_lbl_split / f"{img.stem}.txt", dst_lbl_split / f"{img.stem}.txt")
                 count += 1
             print(f"  {split}: {count} images copied")
     
     # Create data.yaml
     data_yaml = dst_base / "data.yaml"
-    with open(data_yaml, 'w') as f:
-        f.write(f"path: {dst_base.absolute()}\n")
-        f.write("train: images/train\n")
-        f.write("val: images/val\n")
-        f.write("test: images/test\n")
-        f.write("nc: 1\n")
-        f.write("names: ['rock']\n")
+    data_yaml.write_text(
+        f"""path: {dst_base.absolute()}
+train: images/train
+val: images/val
+test: images/test
+nc: 1
+names: ['rock']
+"""
+    )
     
     # Summary
     print()
@@ -10,6 +10,9 @@ import numpy as np
 import matplotlib.pyplot as plt
 import albumentations as A
 
+# OpenCV >= 4.10 can decode straight to RGB, saving a cvtColor pass
+IMREAD_COLOR_RGB = getattr(cv2, 'IMREAD_COLOR_RGB', None)
+
 # Define individual augmentations (same params as your pipeline)
 AUGMENTATIONS = {
     "Original": None,
@@ -30,9 +33,20 @@ AUGMENTATIONS = {
     ),
 }
 
+def build_pipelines():
+    """Wrap each augmentation in a Compose once, with the same bbox params as training."""
+    return {
+        name: None if aug is None else A.Compose(
+            [aug], bbox_params=A.BboxParams(format='yolo', min_visibility=0.1)
+        )
+        for name, aug in AUGMENTATIONS.items()
+    }
+
 def load_yolo_image_and_boxes(img_path, label_path):
-    image = cv2.imread(str(img_path))
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    if IMREAD_COLOR_RGB is not None:
+        image = cv2.imread(str(img_path), IMREAD_COLOR_RGB)
+    else:
+        image = cv2.cvtColor(cv2.imread(str(img_path)), cv2.COLOR_BGR2RGB)
     
     bboxes, labels = [], []
     if label_path.exists():
@@ -45,31 +59,40 @@ def load_yolo_image_and_boxes(img_path, label_path):
     return image, bboxes, labels
 
 def apply_aug_and_draw(image, bboxes, labels, aug_name, transform):
+    # transform is a prebuilt Compose from build_pipelines() (or None for the original).
+    # The image is not copied: draw_boxes() draws on its own copy.
     if transform is None:
-        aug_img, aug_boxes = image.copy(), bboxes
+        aug_img, aug_boxes = image, bboxes
     else:
         try:
-            # Use same bbox params as your training
-            composed = A.Compose([transform], 
-                bbox_params=A.BboxParams(format='yolo', min_visibility=0.1)
-            )
-            result = composed(image=image, bboxes=bboxes, class_labels=labels)
+            result = transform(image=image, bboxes=bboxes, class_labels=labels)
             aug_img = result['image']
             aug_boxes = result['bboxes']
         except Exception as e:
             print(f"⚠️ Failed {aug_name}: {e}")
-            aug_img, aug_boxes = image.copy(), []
+            aug_img, aug_boxes = image, []
     return aug_img, aug_boxes
 
-def draw_boxes(image, bboxes):
+def draw_boxes(image, bboxes, color=(255, 0, 0), thickness=2):
     h, w = image.shape[:2]
     out = image.copy()
-    for cx, cy, bw, bh in bboxes:
-        x1 = int((cx - bw/2) * w)
-        y1 = int((cy - bh/2) * h)
-        x2 = int((cx + bw/2) * w)
-        y2 = int((cy + bh/2) * h)
-        cv2.rectangle(out, (x1, y1), (x2, y2), (255, 0, 0), 2)
+    if len(bboxes) == 0:
+        return out
+    
+    # All corners at once: (N, 4) of x1, y1, x2, y2 in pixels
+    arr = np.asarray(bboxes, dtype=np.float64)[:, :4]
+    half = arr[:, 2:] / 2
+    corners = (np.hstack([arr[:, :2] - half, arr[:, :2] + half]) * [w, h, w, h]).astype(np.int32)
+    
+    x1, y1, x2, y2 = corners.T
+    
+    # One polylines call for all boxes; OpenCV clips at the image border itself
+    # (same pixels as a cv2.rectangle per box)
+    quads = np.stack([
+        np.column_stack([x1, y1]), np.column_stack([x2, y1]),
+        np.column_stack([x2, y2]), np.column_stack([x1, y2]),
+    ], axis=1).reshape(-1, 4, 1, 2)
+    cv2.polylines(out, list(quads), True, color, thickness)
     return out
 
 def main():
@@ -91,7 +114,8 @@ def main():
     fig, axes = plt.subplots(rows, cols, figsize=(6*cols, 5*rows))
     axes = axes.flatten() if n > 1 else [axes]
 
-    for idx, (name, aug) in enumerate(AUGMENTATIONS.items()):
+    pipelines = build_pipelines()
+    for idx, (name, aug) in enumerate(pipelines.items()):
         aug_img, aug_boxes = apply_aug_and_draw(image, bboxes, labels, name, aug)
         img_with_boxes = draw_boxes(aug_img, aug_boxes)
         axes[idx].imshow(img_with_boxes)
@@ -105,7 +129,7 @@ def main():
     output_dir.mkdir(parents=True, exist_ok=True)
     out_path = output_dir / f"aug_isolated_{img_name}.png"
     plt.tight_layout()
-    plt.savefig(out_path, dpi=150, bbox_inches='tight')
+    plt.savefig(out_path, dpi=100, bbox_inches='tight', pil_kwargs={'compress_level': 1})
     plt.close()
     print(f"✅ Saved isolated augmentations to {out_path}")
 
@@ -0,0 +1,38 @@
+"""
+YOLO label loading shared by the duplicate suppression scripts.
+"""
+
+import os
+
+import numpy as np
+
+
+def _parse_yolo_lines(label_path, dtype):
+    """Tolerant line-by-line parse: short or non-numeric lines are skipped."""
+    rows = []
+    with open(label_path, 'r', errors='ignore') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            try:
+                rows.append([float(x) for x in parts[:5]])
+            except ValueError:
+                continue
+    return np.array(rows, dtype=dtype).reshape(-1, 5)
+
+
+def load_yolo_labels(label_path, dtype=np.float32):
+    """Load a YOLO label file as an (N, 5) array of class, cx, cy, w, h."""
+    try:
+        if os.stat(label_path).st_size == 0:
+            return np.empty((0, 5), dtype=dtype)
+    except FileNotFoundError:
+        return np.empty((0, 5), dtype=dtype)
+    
+    # Single C-level parse of the whole file, extra columns (e.g. score) are ignored.
+    # Malformed files fall back to the per-line parser, which skips the bad lines.
+    try:
+        return np.loadtxt(label_path, dtype=dtype, ndmin=2, usecols=range(5))
+    except ValueError:
+        return _parse_yolo_lines(label_path, dtype)
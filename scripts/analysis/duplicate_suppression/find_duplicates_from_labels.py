@@ -4,11 +4,31 @@ Find duplicates by comparing YOLO labels directly, using patch naming to identif
 This correctly handles patch-local to tile-global coordinate conversion.
 """
 
+import os
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import numpy as np
+from scipy.spatial import cKDTree
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
+from _labels import load_yolo_labels
+
+
+# Maximum distance between centers to consider two boxes the same rock (pixels)
+DISTANCE_THRESHOLD = 15.0
+
+# Patch grid used when the tiles were cut (pixels)
+PATCH_SIZE = 640
+OVERLAP = 210
+
+
+@lru_cache(maxsize=None)
 def parse_patch_name(filename):
     """
     Extract tile ID and patch position from filename.
@@ -25,73 +45,155 @@ def parse_patch_name(filename):
     return None, None, None
 
 
-def load_yolo_boxes(label_path):
-    """Load YOLO boxes from a label file."""
-    boxes = []
-    with open(label_path, 'r') as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) >= 5:
-                cls = int(parts[0])
-                cx, cy, w, h = map(float, parts[1:5])
-                boxes.append((cls, cx, cy, w, h))
-    return boxes
-
-
-def box_to_global_coords(box, patch_row, patch_col, patch_size=640, overlap=210):
+def boxes_to_global_coords(boxes, rows, cols, patch_size=PATCH_SIZE, overlap=OVERLAP):
     """
     Convert patch-local normalized coordinates to global tile pixel coordinates.
     
     Args:
-        box: (class, cx, cy, w, h) in normalized [0-1] coordinates
-        patch_row, patch_col: Position of patch in tile grid
+        boxes: (N, 5) array of (class, cx, cy, w, h) in normalized [0-1] coordinates
+        rows, cols: Position of the patch in the tile grid (scalars, or (N,) arrays with one per box)
         patch_size: Size of each patch in pixels (default 640)
         overlap: Overlap between patches in pixels (default 210)
     
     Returns:
-        (global_cx, global_cy, w_pixels, h_pixels)
+        (N, 4) array of (global_cx, global_cy, w_pixels, h_pixels)
     """
-    cls, cx, cy, w, h = box
-    
     # Convert normalized [0-1] to patch-local pixels
-    px_local = cx * patch_size
-    py_local = cy * patch_size
-    w_pixels = w * patch_size
-    h_pixels = h * patch_size
+    global_boxes = boxes[:, 1:5] * patch_size
     
     # Calculate stride (distance between patch origins)
     stride = patch_size - overlap
     
     # Convert to global tile coordinates
-    global_cx = px_local + patch_col * stride
-    global_cy = py_local + patch_row * stride
+    global_boxes[:, 0] += cols * stride
+    global_boxes[:, 1] += rows * stride
     
-    return global_cx, global_cy, w_pixels, h_pixels
+    return global_boxes
+
+
+# Grid offsets of the neighbouring patches that can overlap a patch. stride > overlap,
+# so only direct neighbours share pixels; each unordered pair is visited once.
+NEIGHBOUR_OFFSETS = ((0, 1), (1, -1), (1, 0), (1, 1))
+
 
+if njit is not None:
+    @njit(cache=True)
+    def _find_dups_between(centers1, centers2, threshold):
+        """Compiled brute-force search of box pairs (one per set) closer than threshold."""
+        t2 = threshold * threshold
+        pairs = np.empty((16, 2), dtype=np.int64)
+        k = 0
+        for i in range(centers1.shape[0]):
+            for j in range(centers2.shape[0]):
+                dx = centers1[i, 0] - centers2[j, 0]
+                dy = centers1[i, 1] - centers2[j, 1]
+                if dx * dx + dy * dy < t2:
+                    if k == pairs.shape[0]:
+                        grown = np.empty((2 * k, 2), dtype=np.int64)
+                        grown[:k] = pairs
+                        pairs = grown
+                    pairs[k, 0] = i
+                    pairs[k, 1] = j
+                    k += 1
+        return pairs[:k]
 
-def boxes_are_duplicates(box1_global, box2_global, distance_threshold=15.0):
+
+def find_duplicate_pairs(centers1, centers2, threshold=DISTANCE_THRESHOLD):
     """
-    Check if two boxes in global coordinates represent the same rock.
+    Find pairs of boxes from two patches whose centers are closer than threshold.
     
     Args:
-        box1_global, box2_global: (cx, cy, w, h) in global pixel coordinates
-        distance_threshold: Maximum distance between centers to consider duplicate (pixels)
+        centers1, centers2: (N, 2) and (M, 2) global box centers of the two patches
+        threshold: Maximum distance between centers (pixels)
     
     Returns:
-        (is_duplicate, distance)
+        (idx1, idx2, dist) arrays, sorted by idx1 then idx2
     """
-    cx1, cy1, w1, h1 = box1_global
-    cx2, cy2, w2, h2 = box2_global
+    if njit is not None:
+        # Few boxes per patch: a compiled double loop beats building trees
+        pairs = _find_dups_between(centers1, centers2, threshold)
+        idx1, idx2 = pairs[:, 0], pairs[:, 1]
+        return idx1, idx2, np.hypot(*(centers1[idx1] - centers2[idx2]).T)
     
-    # Calculate Euclidean distance between centers
-    distance = np.sqrt((cx1 - cx2)**2 + (cy1 - cy2)**2)
+    # Candidate pairs within the threshold, found with KD-trees
+    pairs = cKDTree(centers1).sparse_distance_matrix(cKDTree(centers2), threshold, output_type='ndarray')
     
-    return distance < distance_threshold, distance
+    # Drop pairs sitting exactly on the threshold
+    pairs = np.sort(pairs[pairs['v'] < threshold], order=['i', 'j'])
+    return pairs['i'].astype(np.int64), pairs['j'].astype(np.int64), pairs['v']
 
 
-def main():
-    import os
+def overlap_band_mask(boxes, offset, threshold=DISTANCE_THRESHOLD):
+    """
+    Mask of the boxes that can be duplicated in the neighbouring patch at grid offset (drow, dcol).
+    
+    Only boxes whose center lies in the band shared with the neighbour (widened by
+    the distance threshold) can match a box of that neighbour.
+    """
+    stride = PATCH_SIZE - OVERLAP
+    mask = np.ones(len(boxes), dtype=bool)
+    
+    for column, d in ((2, offset[0]), (1, offset[1])):  # cy follows rows, cx follows cols
+        local = boxes[:, column] * PATCH_SIZE
+        if d > 0:
+            mask &= local > stride - threshold
+        elif d < 0:
+            mask &= local < OVERLAP + threshold
+    
+    return mask
+
+
+def process_tile(tile_id, patches):
+    """
+    Find all duplicate box pairs between the patches of one tile.
     
+    Args:
+        tile_id: Tile identifier (e.g. '2587_1133')
+        patches: List of (label_name, row, col, boxes, global_boxes) for the tile, in name order
+    
+    Returns:
+        List of duplicate dicts (img1, img2, box1, box2, global1, global2, distance)
+    """
+    by_pos = {(row, col): k for k, (_, row, col, _, _) in enumerate(patches)}
+    
+    # Only compare patches that are grid neighbours
+    patch_pairs = []
+    for k, (_, row, col, _, _) in enumerate(patches):
+        for dr, dc in NEIGHBOUR_OFFSETS:
+            m = by_pos.get((row + dr, col + dc))
+            if m is not None:
+                # Keep the name order of the patches: img1 is the first one
+                patch_pairs.append((min(k, m), max(k, m)))
+    
+    duplicates_in_tile = []
+    for i, j in sorted(patch_pairs):
+        name1, row1, col1, boxes1, globals1 = patches[i]
+        name2, row2, col2, boxes2, globals2 = patches[j]
+        
+        # Keep only the boxes lying in the overlap band of the two patches
+        offset = (row2 - row1, col2 - col1)
+        sel1 = np.flatnonzero(overlap_band_mask(boxes1, offset))
+        sel2 = np.flatnonzero(overlap_band_mask(boxes2, (-offset[0], -offset[1])))
+        if len(sel1) == 0 or len(sel2) == 0:
+            continue
+        
+        idx1, idx2, dist = find_duplicate_pairs(globals1[sel1, :2], globals2[sel2, :2])
+        idx1, idx2 = sel1[idx1], sel2[idx2]
+        for a, b, d in zip(idx1, idx2, dist):
+            duplicates_in_tile.append({
+                'img1': name1,
+                'img2': name2,
+                'box1': (int(boxes1[a, 0]), *boxes1[a, 1:].tolist()),
+                'box2': (int(boxes2[b, 0]), *boxes2[b, 1:].tolist()),
+                'global1': tuple(globals1[a].tolist()),
+                'global2': tuple(globals2[b].tolist()),
+                'distance': float(d)
+            })
+    
+    return duplicates_in_tile
+
+
+def main():
     # Navigate to project root
     script_dir = Path(__file__).parent
     project_root = script_dir.parent.parent.parent
@@ -112,11 +214,18 @@ def main():
     # Group labels by tile
     tiles = defaultdict(list)
     
-    for label_file in sorted(labels_dir.glob("*.txt")):
-        tile_id, row, col = parse_patch_name(label_file.name)
+    # Single directory scan, no per-file stat from glob
+    with os.scandir(labels_dir) as it:
+        label_names = sorted(entry.name for entry in it if entry.name.endswith('.txt'))
+    
+    for label_name in label_names:
+        tile_id, row, col = parse_patch_name(label_name)
         if tile_id:
-            boxes = load_yolo_boxes(label_file)
-            tiles[tile_id].append((label_file.name, row, col, boxes))
+            # float64 keeps the global coordinates and distances in the report exact
+            boxes = load_yolo_labels(labels_dir / label_name, dtype=np.float64)
+            # Global coordinates are computed once per patch, at load time
+            global_boxes = boxes_to_global_coords(boxes, row, col)
+            tiles[tile_id].append((label_name, row, col, boxes, global_boxes))
     
     print(f"Found {len(tiles)} unique tiles")
     print(f"Total patches: {sum(len(patches) for patches in tiles.values())}")
@@ -126,57 +235,29 @@ def main():
     total_duplicates = 0
     all_duplicate_pairs = []
     
-    for tile_id, patches in sorted(tiles.items()):
-        if len(patches) < 2:
-            continue  # No overlaps possible with single patch
-        
-        print(f"Tile {tile_id}: {len(patches)} patches")
-        
-        duplicates_in_tile = []
+    # No overlaps possible with single patch
+    tile_items = [(tile_id, patches) for tile_id, patches in sorted(tiles.items()) if len(patches) >= 2]
+    
+    # Tiles are independent: search them in parallel, results come back in tile order
+    with ProcessPoolExecutor() as ex:
+        tile_results = ex.map(process_tile, *zip(*tile_items), chunksize=16) if tile_items else []
         
-        # Compare all patch pairs
-        for i in range(len(patches)):
-            img1, row1, col1, boxes1 = patches[i]
+        for (tile_id, patches), duplicates_in_tile in zip(tile_items, tile_results):
+            print(f"Tile {tile_id}: {len(patches)} patches")
             
-            for j in range(i + 1, len(patches)):
-                img2, row2, col2, boxes2 = patches[j]
-                
-                # Compare all box pairs
-                for box_idx1, box1 in enumerate(boxes1):
-                    # Convert box1 to global coordinates
-                    global1 = box_to_global_coords(box1, row1, col1)
-                    
-                    for box_idx2, box2 in enumerate(boxes2):
-                        # Convert box2 to global coordinates
-                        global2 = box_to_global_coords(box2, row2, col2)
-                        
-                        # Check if they're duplicates
-                        is_dup, distance = boxes_are_duplicates(global1, global2)
-                        
-                        if is_dup:
-                            duplicates_in_tile.append({
-                                'img1': img1,
-                                'img2': img2,
-                                'box1': box1,
-                                'box2': box2,
-                                'global1': global1,
-                                'global2': global2,
-                                'distance': distance
-                            })
-        
-        if duplicates_in_tile:
-            print(f"  Found {len(duplicates_in_tile)} duplicate pair(s):")
-            for dup in duplicates_in_tile:
-                print(f"    {dup['img1']} ↔ {dup['img2']}")
-                print(f"      Distance: {dup['distance']:.2f} pixels")
-                print(f"      Global coords 1: ({dup['global1'][0]:.1f}, {dup['global1'][1]:.1f})")
-                print(f"      Global coords 2: ({dup['global2'][0]:.1f}, {dup['global2'][1]:.1f})")
-            total_duplicates += len(duplicates_in_tile)
-            all_duplicate_pairs.extend(duplicates_in_tile)
-        else:
-            print(f"  No duplicates found")
-        
-        print()
+            if duplicates_in_tile:
+                print(f"  Found {len(duplicates_in_tile)} duplicate pair(s):")
+                for dup in duplicates_in_tile:
+                    print(f"    {dup['img1']} ↔ {dup['img2']}")
+                    print(f"      Distance: {dup['distance']:.2f} pixels")
+                    print(f"      Global coords 1: ({dup['global1'][0]:.1f}, {dup['global1'][1]:.1f})")
+                    print(f"      Global coords 2: ({dup['global2'][0]:.1f}, {dup['global2'][1]:.1f})")
+                total_duplicates += len(duplicates_in_tile)
+                all_duplicate_pairs.extend(duplicates_in_tile)
+            else:
+                print(f"  No duplicates found")
+            
+            print()
     
     print("=" * 80)
     print(f"SUMMARY")
@@ -200,7 +281,19 @@ def main():
             f.write(f"  Global coords 1: ({dup['global1'][0]:.1f}, {dup['global1'][1]:.1f})\n")
             f.write(f"  Global coords 2: ({dup['global2'][0]:.1f}, {dup['global2'][1]:.1f})\n\n")
     
+    # Structured copy for visualize_duplicate_pairs.py (no text parsing needed)
+    npz_file = output_file.with_suffix('.npz')
+    np.savez_compressed(
+        npz_file,
+        img1=np.array([dup['img1'] for dup in all_duplicate_pairs], dtype=str),
+        img2=np.array([dup['img2'] for dup in all_duplicate_pairs], dtype=str),
+        g1=np.array([dup['global1'][:2] for dup in all_duplicate_pairs], dtype=np.float32).reshape(-1, 2),
+        g2=np.array([dup['global2'][:2] for dup in all_duplicate_pairs], dtype=np.float32).reshape(-1, 2),
+        dist=np.array([dup['distance'] for dup in all_duplicate_pairs], dtype=np.float32),
+    )
+    
     print(f"✅ Detailed results saved to {output_file}")
+    print(f"✅ Structured results saved to {npz_file}")
     print("=" * 80)
 
 
@@ -4,14 +4,45 @@ Visualize REAL duplicate pairs found by label-based method.
 Shows ALL duplicates between two patches in a single visualization.
 """
 
+import os
+import re
+import traceback
+import cv2
 import rasterio
+from rasterio.enums import Resampling
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
+from _labels import load_yolo_labels
 
+
+# Box colours (BGR) and caption font
+DUP_COLOR = (0, 0, 255)
+OTHER_COLOR = (0, 128, 0)
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+# Figure layout (pixels)
+SEPARATOR_WIDTH = 20
+LEGEND_HEIGHT = 40
+
+# Output canvases reused across pairs, keyed by (height, width)
+_CANVAS = {}
+
+# One "Pair N:" record of the real_duplicates.txt report
+DUPLICATE_RECORD_RE = re.compile(
+    r'Image 1:\s*(\S+)\s+Image 2:\s*(\S+)\s+Distance:[^\n]*\n'
+    r'\s*Global coords 1:\s*\(([^)]+)\)\s+Global coords 2:\s*\(([^)]+)\)'
+)
+
+# Patches are previewed at about this many pixels on their short side, decimated by an
+# integer factor (boxes are scaled to the loaded image)
+PREVIEW_SIZE = 320
+
+
+@lru_cache(maxsize=None)
 def parse_patch_name(filename):
     """Extract tile ID and patch position from filename."""
     stem = filename.replace('.txt', '').replace('.tif', '')
@@ -25,43 +56,50 @@ def parse_patch_name(filename):
     return None, None, None
 
 
-def load_yolo_boxes(label_path):
-    """Load YOLO boxes from a label file."""
-    boxes = []
-    with open(label_path, 'r') as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) >= 5:
-                cls = int(parts[0])
-                cx, cy, w, h = map(float, parts[1:5])
-                boxes.append((cls, cx, cy, w, h))
-    return boxes
-
-
-def load_tif_image(tif_path):
-    """Load a TIF image for visualization."""
+@lru_cache(maxsize=64)
+def load_tif_image(tif_path, target_size=PREVIEW_SIZE):
+    """
+    Load a TIF image for visualization, decimated by an integer factor so that
+    its short side is close to target_size (never upsampled).
+    
+    Cached by path (pass a str): a patch usually takes part in several
+    duplicate pairs, so the same file would otherwise be decoded repeatedly.
+    The returned array is shared between calls and must not be modified.
+    """
     with rasterio.open(tif_path) as src:
-        image = src.read()
-        
-        if image.shape[0] == 3:
+        # Only read the bands that are displayed, at preview resolution
+        scale = max(1, min(src.width, src.height) // target_size)
+        out_h = max(src.height // scale, 1)
+        out_w = max(src.width // scale, 1)
+        if src.count >= 3:
+            image = src.read([1, 2, 3], out_shape=(3, out_h, out_w), resampling=Resampling.average)
             image = np.transpose(image, (1, 2, 0))
-        elif image.shape[0] == 1:
-            image = image[0]
         else:
-            image = np.transpose(image[:3], (1, 2, 0))
-        
-        if image.dtype == np.uint16:
-            image = image.astype(np.float32) / 65535.0
-        elif image.dtype == np.uint8:
-            image = image.astype(np.float32) / 255.0
-        elif image.dtype in [np.float32, np.float64]:
-            img_min = np.nanmin(image)
-            img_max = np.nanmax(image)
-            if img_max > img_min:
-                image = (image - img_min) / (img_max - img_min)
-            image = np.clip(image, 0, 1)
-        
-        return image
+            image = src.read(1, out_shape=(out_h, out_w), resampling=Resampling.average)
+    
+    # Display as uint8 (a quarter of the memory of float32, no division pass).
+    # The read buffer is fresh, so it is normalized in place before the final cast.
+    if image.dtype == np.uint16:
+        np.right_shift(image, 8, out=image)
+        image = image.astype(np.uint8)
+    elif image.dtype in [np.float32, np.float64]:
+        finite = np.isfinite(image)
+        if not finite.any():
+            return np.zeros(image.shape, dtype=np.uint8)
+        img_min = image[finite].min()
+        img_max = image[finite].max()
+        # NaN/inf pixels take the band minimum (black) before any scaling
+        np.nan_to_num(image, copy=False, nan=img_min, posinf=img_min, neginf=img_min)
+        if img_max > img_min:
+            np.subtract(image, img_min, out=image)
+            np.multiply(image, 255.0 / (img_max - img_min), out=image)
+            np.clip(image, 0, 255, out=image)
+            image = image.astype(np.uint8)
+        else:
+            # Flat band: shown at its value clipped to 0..1, as a 0..1 float image would be
+            image = np.full(image.shape, round(255 * float(np.clip(img_min, 0, 1))), dtype=np.uint8)
+    
+    return image
 
 
 def yolo_to_pixel_bbox(cx, cy, w, h, img_width=640, img_height=640):
@@ -79,39 +117,113 @@ def yolo_to_pixel_bbox(cx, cy, w, h, img_width=640, img_height=640):
     return xmin, ymin, xmax, ymax
 
 
-def find_matching_boxes(target_globals, boxes, patch_row, patch_col, 
-                       patch_size=640, overlap=210, threshold=20.0):
+def box_global_centers(boxes, patch_row, patch_col, patch_size=640, overlap=210):
+    """(N, 2) global tile pixel centers of a patch's boxes: patch-local pixels + patch origin."""
+    stride = patch_size - overlap
+    offset = np.array([patch_col * stride, patch_row * stride], dtype=np.float64)
+    return boxes[:, 1:3] * patch_size + offset
+
+
+def find_matching_boxes(target_globals, centers, threshold=20.0):
     """
-    Find ALL boxes that match any of the target global coordinates.
+    Find ALL boxes (given by their global centers) that match any of the target global coordinates.
     Returns set of indices.
     """
-    stride = patch_size - overlap
-    matching_indices = set()
+    if len(centers) == 0 or len(target_globals) == 0:
+        return set()
     
-    for target_global in target_globals:
-        for idx, box in enumerate(boxes):
-            cls, cx, cy, w, h = box
-            
-            # Convert to patch-local pixels
-            px_local = cx * patch_size
-            py_local = cy * patch_size
-            
-            # Convert to global
-            global_cx = px_local + patch_col * stride
-            global_cy = py_local + patch_row * stride
-            
-            # Check if this matches our target
-            distance = np.sqrt((global_cx - target_global[0])**2 + 
-                             (global_cy - target_global[1])**2)
-            
-            if distance < threshold:
-                matching_indices.add(idx)
+    # (M, N) squared distances between targets and boxes, one axis at a time
+    # (no (M, N, 2) temporary, no sqrt)
+    targets = np.asarray(target_globals)
+    dx = centers[None, :, 0] - targets[:, 0:1]
+    dy = centers[None, :, 1] - targets[:, 1:2]
+    d2 = dx * dx + dy * dy
+    
+    return set(np.flatnonzero(np.any(d2 < threshold ** 2, axis=0)).tolist())
+
+
+def get_canvas(height, width):
+    """
+    White BGR canvas of the given size.
+    The buffer is kept and reused by the next pair of the same size (one per worker).
+    """
+    canvas = _CANVAS.get((height, width))
+    if canvas is None:
+        canvas = _CANVAS[(height, width)] = np.empty((height, width, 3), dtype=np.uint8)
+    canvas.fill(255)
+    return canvas
+
+
+def paste_image(canvas, image, x0, y0):
+    """Copy a uint8 display image (RGB or single band) into the BGR canvas at (x0, y0)."""
+    h, w = image.shape[:2]
+    target = canvas[y0:y0 + h, x0:x0 + w]
+    if image.ndim == 2:
+        target[...] = image[:, :, None]
+    else:
+        target[...] = image[:, :, ::-1]
+
+
+def draw_box_outlines(canvas, boxes, dup_indices, x0, y0, w, h):
+    """
+    Draw all box outlines of a w x h image pasted at (x0, y0) on the canvas.
+    Duplicate boxes are drawn in thick red, other boxes in thinner green,
+    with one cv2.polylines call per style.
+    """
+    if len(boxes) == 0:
+        return
+    
+    xmin, ymin, xmax, ymax = yolo_to_pixel_bbox(boxes[:, 1], boxes[:, 2], boxes[:, 3], boxes[:, 4], w, h)
+    xmin, xmax = x0 + xmin.astype(np.int32), x0 + xmax.astype(np.int32)
+    ymin, ymax = y0 + ymin.astype(np.int32), y0 + ymax.astype(np.int32)
+    
+    # (N, 4, 2) corners of every box
+    corners = np.stack([
+        np.stack([xmin, xmax, xmax, xmin], axis=1),
+        np.stack([ymin, ymin, ymax, ymax], axis=1),
+    ], axis=2)
+    
+    is_dup = np.zeros(len(boxes), dtype=bool)
+    is_dup[list(dup_indices)] = True
     
-    return matching_indices
+    for mask, color, thickness in ((~is_dup, OTHER_COLOR, 2), (is_dup, DUP_COLOR, 3)):
+        if mask.any():
+            cv2.polylines(canvas, list(corners[mask]), True, color, thickness)
+
+
+def text_band_height(n_lines, scale=0.6):
+    """Height of a band holding n_lines of text at the given scale."""
+    return (int(30 * scale) + 10) * n_lines + 10
+
+
+def draw_text_band(canvas, lines, x0, y0, width, scale=0.6, thickness=1):
+    """Draw one line of black text per entry, centered in the band starting at (x0, y0)."""
+    line_height = int(30 * scale) + 10
+    
+    for i, line in enumerate(lines):
+        (text_w, _), _ = cv2.getTextSize(line, FONT, scale, thickness)
+        origin = (x0 + max((width - text_w) // 2, 0), y0 + line_height * (i + 1))
+        cv2.putText(canvas, line, origin, FONT, scale, (0, 0, 0), thickness, cv2.LINE_AA)
+
+
+def draw_legend(canvas, n_duplicates, y0):
+    """Draw the red/green legend in the LEGEND_HEIGHT band starting at row y0."""
+    entries = [
+        (DUP_COLOR, 3, f'Duplicate rocks ({n_duplicates} rocks in both patches)'),
+        (OTHER_COLOR, 2, 'Other rocks'),
+    ]
+    
+    x = 10
+    for color, thickness, label in entries:
+        cv2.rectangle(canvas, (x, y0 + 12), (x + 24, y0 + 28), color, thickness)
+        cv2.putText(canvas, label, (x + 34, y0 + 26), FONT, 0.5, (0, 0, 0), 1, cv2.LINE_AA)
+        (text_w, _), _ = cv2.getTextSize(label, FONT, 0.5, 1)
+        x += text_w + 70
 
 
 def visualize_duplicate_pair(img1_name, img2_name, duplicate_coords,
-                            labels_dir, images_dir, output_path):
+                            labels_dir, images_dir, output_path, boxes1=None, boxes2=None,
+                            centers1=None, centers2=None):
     """
     Visualize ALL duplicates between two patches.
     
@@ -119,6 +231,13 @@ def visualize_duplicate_pair(img1_name, img2_name, duplicate_coords,
         img1_name: First patch filename
         img2_name: Second patch filename
         duplicate_coords: List of (global1, global2) tuples for all duplicates
+        boxes1, boxes2: Already loaded (N, 5) label arrays of the two patches
+            (read from labels_dir when not given)
+        centers1, centers2: Precomputed global box centers of the two patches
+            (computed from the boxes when not given)
+    
+    Returns:
+        (number of duplicate boxes in image 1, number of duplicate boxes in image 2)
     """
     
     # Parse patch positions
@@ -129,82 +248,51 @@ def visualize_duplicate_pair(img1_name, img2_name, duplicate_coords,
     img1_path = Path(images_dir) / img1_name.replace('.txt', '.tif')
     img2_path = Path(images_dir) / img2_name.replace('.txt', '.tif')
     
-    print(f"  Loading {img1_name}...")
-    img1 = load_tif_image(img1_path)
-    print(f"  Loading {img2_name}...")
-    img2 = load_tif_image(img2_path)
+    img1 = load_tif_image(str(img1_path))
+    img2 = load_tif_image(str(img2_path))
     
     # Load all boxes from both label files
-    label1_path = Path(labels_dir) / img1_name
-    label2_path = Path(labels_dir) / img2_name
-    
-    boxes1 = load_yolo_boxes(label1_path)
-    boxes2 = load_yolo_boxes(label2_path)
+    if boxes1 is None:
+        boxes1 = load_yolo_labels(Path(labels_dir) / img1_name)
+    if boxes2 is None:
+        boxes2 = load_yolo_labels(Path(labels_dir) / img2_name)
     
     # Find which boxes are duplicates
     globals1 = [coord[0] for coord in duplicate_coords]
     globals2 = [coord[1] for coord in duplicate_coords]
     
-    dup_indices1 = find_matching_boxes(globals1, boxes1, row1, col1)
-    dup_indices2 = find_matching_boxes(globals2, boxes2, row2, col2)
+    if centers1 is None:
+        centers1 = box_global_centers(boxes1, row1, col1)
+    if centers2 is None:
+        centers2 = box_global_centers(boxes2, row2, col2)
     
-    print(f"  Found {len(dup_indices1)} duplicate boxes in image 1")
-    print(f"  Found {len(dup_indices2)} duplicate boxes in image 2")
+    dup_indices1 = find_matching_boxes(globals1, centers1)
+    dup_indices2 = find_matching_boxes(globals2, centers2)
     
-    # Create figure
-    fig, axes = plt.subplots(1, 2, figsize=(16, 8))
+    # Layout: title, then captions and images side by side, then legend
+    (h1, w1), (h2, w2) = img1.shape[:2], img2.shape[:2]
+    header_h = text_band_height(3, scale=0.8)
+    caption_h = text_band_height(2)
+    images_y = header_h + caption_h
+    legend_y = images_y + max(h1, h2)
+    x2 = w1 + SEPARATOR_WIDTH
     
-    # Plot image 1
-    ax1 = axes[0]
-    ax1.imshow(img1)
+    # Compose into a reused canvas (the loaded images are cached and shared, never drawn on)
+    canvas = get_canvas(legend_y + LEGEND_HEIGHT, x2 + w2)
+    paste_image(canvas, img1, 0, images_y)
+    paste_image(canvas, img2, x2, images_y)
     
     # Draw all boxes
-    for idx, box in enumerate(boxes1):
-        cls, cx, cy, w, h = box
-        xmin, ymin, xmax, ymax = yolo_to_pixel_bbox(cx, cy, w, h)
-        width = xmax - xmin
-        height = ymax - ymin
-        
-        if idx in dup_indices1:
-            # Duplicate box in RED
-            rect = Rectangle((xmin, ymin), width, height, 
-                           linewidth=3, edgecolor='red', facecolor='none')
-        else:
-            # Other boxes in GREEN
-            rect = Rectangle((xmin, ymin), width, height, 
-                           linewidth=1.5, edgecolor='green', facecolor='none', alpha=0.7)
-        ax1.add_patch(rect)
-    
-    ax1.set_title(f'{img1_name.replace(".txt", ".tif")}\n'
-                  f'Patch [{row1}, {col1}] - {len(dup_indices1)} duplicates', 
-                  fontsize=11)
-    ax1.axis('off')
-    
-    # Plot image 2
-    ax2 = axes[1]
-    ax2.imshow(img2)
-    
-    # Draw all boxes
-    for idx, box in enumerate(boxes2):
-        cls, cx, cy, w, h = box
-        xmin, ymin, xmax, ymax = yolo_to_pixel_bbox(cx, cy, w, h)
-        width = xmax - xmin
-        height = ymax - ymin
-        
-        if idx in dup_indices2:
-            # Duplicate box in RED
-            rect = Rectangle((xmin, ymin), width, height, 
-                           linewidth=3, edgecolor='red', facecolor='none')
-        else:
-            # Other boxes in GREEN
-            rect = Rectangle((xmin, ymin), width, height, 
-                           linewidth=1.5, edgecolor='green', facecolor='none', alpha=0.7)
-        ax2.add_patch(rect)
+    draw_box_outlines(canvas, boxes1, dup_indices1, 0, images_y, w1, h1)
+    draw_box_outlines(canvas, boxes2, dup_indices2, x2, images_y, w2, h2)
     
-    ax2.set_title(f'{img2_name.replace(".txt", ".tif")}\n'
-                  f'Patch [{row2}, {col2}] - {len(dup_indices2)} duplicates', 
-                  fontsize=11)
-    ax2.axis('off')
+    # Caption each image
+    draw_text_band(canvas, [img1_name.replace(".txt", ".tif"),
+                            f'Patch [{row1}, {col1}] - {len(dup_indices1)} duplicates'],
+                   0, header_h, w1)
+    draw_text_band(canvas, [img2_name.replace(".txt", ".tif"),
+                            f'Patch [{row2}, {col2}] - {len(dup_indices2)} duplicates'],
+                   x2, header_h, w2)
     
     # Add overall title
     tile1 = '_'.join(img1_name.split('_')[:2])
@@ -215,30 +303,51 @@ def visualize_duplicate_pair(img1_name, img2_name, duplicate_coords,
         for g1, g2 in duplicate_coords
     ])
     
-    fig.suptitle(f'Duplicate Pair - Tile {tile1}\n'
-                 f'{len(duplicate_coords)} duplicate rocks detected\n'
-                 f'Average distance: {avg_distance:.1f} pixels', 
-                 fontsize=13, fontweight='bold')
+    draw_text_band(canvas, [
+        f'Duplicate Pair - Tile {tile1}',
+        f'{len(duplicate_coords)} duplicate rocks detected',
+        f'Average distance: {avg_distance:.1f} pixels'
+    ], 0, 0, canvas.shape[1], scale=0.8, thickness=2)
     
     # Add legend
-    from matplotlib.patches import Patch
-    legend_elements = [
-        Patch(facecolor='none', edgecolor='red', linewidth=3, 
-              label=f'Duplicate rocks ({len(duplicate_coords)} rocks in both patches)'),
-        Patch(facecolor='none', edgecolor='green', linewidth=1.5, label='Other rocks')
-    ]
-    fig.legend(handles=legend_elements, loc='lower center', ncol=2, 
-               bbox_to_anchor=(0.5, -0.01), fontsize=10)
+    draw_legend(canvas, len(duplicate_coords), legend_y)
+    
+    # Fast, light PNG compression: slightly larger files, much quicker saves
+    cv2.imwrite(str(output_path), canvas, [cv2.IMWRITE_PNG_COMPRESSION, 1])
     
-    plt.tight_layout()
-    plt.savefig(output_path, dpi=150, bbox_inches='tight')
-    print(f"  ✅ Saved to {output_path}")
-    plt.close()
+    return len(dup_indices1), len(dup_indices2)
 
 
-def main():
-    import os
+def render_pair(args):
+    """
+    Worker entry point: render one image pair.
     
+    Returns:
+        (pair_num, (n_dup1, n_dup2) or None, traceback text or None)
+    """
+    pair_num = args[0]
+    try:
+        return pair_num, visualize_duplicate_pair(*args[1:]), None
+    except Exception:
+        return pair_num, None, traceback.format_exc()
+
+
+def iter_duplicates_npz(duplicates_file):
+    """Yield (img1, img2, global1_xy, global2_xy) from real_duplicates.npz."""
+    with np.load(duplicates_file) as data:
+        yield from zip(data['img1'].tolist(), data['img2'].tolist(),
+                       map(tuple, data['g1'].tolist()), map(tuple, data['g2'].tolist()))
+
+
+def iter_duplicates_txt(report_file):
+    """Yield (img1, img2, global1_xy, global2_xy) from the real_duplicates.txt report."""
+    text = Path(report_file).read_text(encoding='utf-8')
+    for m in DUPLICATE_RECORD_RE.finditer(text):
+        yield (m[1], m[2],
+               tuple(map(float, m[3].split(','))), tuple(map(float, m[4].split(','))))
+
+
+def main():
     script_dir = Path(__file__).parent
     project_root = script_dir.parent.parent.parent
     os.chdir(project_root)
@@ -254,68 +363,68 @@ def main():
     output_dir = Path("outputs/duplicate_visualizations_grouped")
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Read the real duplicates file
-    duplicates_file = Path("outputs/duplicate_suppression/real_duplicates.txt")
+    # Read the duplicates written by find_duplicates_from_labels.py
+    # (structured .npz, or the text report from older runs)
+    duplicates_file = Path("outputs/duplicate_suppression/real_duplicates.npz")
+    report_file = duplicates_file.with_suffix('.txt')
     
-    if not duplicates_file.exists():
+    if duplicates_file.exists():
+        duplicates = iter_duplicates_npz(duplicates_file)
+    elif report_file.exists():
+        duplicates = iter_duplicates_txt(report_file)
+    else:
         print(f"❌ Please run find_duplicates_from_labels.py first!")
         print(f"   Expected file: {duplicates_file}")
         return
     
-    # Parse the duplicates file and group by image pair
+    # Group duplicates by image pair
     image_pairs = defaultdict(list)  # key: (img1, img2), value: list of (global1, global2)
     
-    with open(duplicates_file, 'r') as f:
-        lines = f.readlines()
-        
-        i = 0
-        while i < len(lines):
-            if lines[i].startswith("Pair"):
-                img1 = lines[i+1].split(': ')[1].strip()
-                img2 = lines[i+2].split(': ')[1].strip()
-                
-                coords1_line = lines[i+4]
-                coords2_line = lines[i+5]
-                
-                # Parse coordinates
-                coords1_str = coords1_line.split(': ')[1].strip()
-                coords1 = tuple(map(float, coords1_str.strip('()').split(', ')))
-                
-                coords2_str = coords2_line.split(': ')[1].strip()
-                coords2 = tuple(map(float, coords2_str.strip('()').split(', ')))
-                
-                # Group by image pair (order-independent)
-                pair_key = tuple(sorted([img1, img2]))
-                image_pairs[pair_key].append((coords1, coords2))
-                
-                i += 7
-            else:
-                i += 1
+    for img1, img2, g1, g2 in duplicates:
+        # Group by image pair (order-independent)
+        pair_key = tuple(sorted([img1, img2]))
+        image_pairs[pair_key].append((g1, g2))
     
     print(f"Found {len(image_pairs)} unique image pairs")
     print(f"Total duplicate rocks: {sum(len(dups) for dups in image_pairs.values())}")
     print()
     
-    # Visualize each image pair
-    for pair_num, ((img1, img2), duplicate_coords) in enumerate(sorted(image_pairs.items()), 1):
-        print(f"--- Processing Pair {pair_num}/{len(image_pairs)} ---")
-        print(f"  {img1} ↔ {img2}")
-        print(f"  {len(duplicate_coords)} duplicate rocks")
-        
-        output_path = output_dir / f"duplicate_pair_{pair_num:02d}.png"
-        
-        try:
-            visualize_duplicate_pair(
-                img1, img2,
-                duplicate_coords,
-                labels_dir, images_dir, output_path
-            )
-        except Exception as e:
-            print(f"  ❌ Error: {e}")
-            import traceback
-            traceback.print_exc()
+    # A patch usually appears in several pairs: read each label file only once
+    unique_imgs = sorted({img for pair in image_pairs for img in pair})
+    boxes_cache = {img: load_yolo_labels(labels_dir / img) for img in unique_imgs
+                   if (labels_dir / img).exists()}
+    
+    # ... and compute the global centers of its boxes once as well
+    centers_cache = {img: box_global_centers(boxes, *parse_patch_name(img)[1:])
+                     for img, boxes in boxes_cache.items()}
+    
+    pair_items = sorted(image_pairs.items())
+    pair_args = [
+        (pair_num, img1, img2, duplicate_coords, labels_dir, images_dir,
+         output_dir / f"duplicate_pair_{pair_num:02d}.png", boxes_cache.get(img1), boxes_cache.get(img2),
+         centers_cache.get(img1), centers_cache.get(img2))
+        for pair_num, ((img1, img2), duplicate_coords) in enumerate(pair_items, 1)
+    ]
+    
+    # Pairs are independent: render them in parallel. Consecutive pairs share patches,
+    # so chunks keep them in the same worker's image cache. Results come back in order.
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        results = ex.map(render_pair, pair_args, chunksize=4)
         
-        print()
+        for ((img1, img2), duplicate_coords), (pair_num, counts, error) in zip(pair_items, results):
+            print(f"--- Processing Pair {pair_num}/{len(image_pairs)} ---")
+            print(f"  {img1} ↔ {img2}")
+            print(f"  {len(duplicate_coords)} duplicate rocks")
+            
+            if error is None:
+                print(f"  Found {counts[0]} duplicate boxes in image 1")
+                print(f"  Found {counts[1]} duplicate boxes in image 2")
+                print(f"  ✅ Saved to {pair_args[pair_num - 1][6]}")
+            else:
+                print(f"  ❌ Error:")
+                print(error)
+            
+            print()
     
     print("=" * 80)
     print(f"✅ Done! Visualizations saved to {output_dir}/")
@@ -28,6 +28,10 @@ def main() -> None:
     parser.add_argument("--iou", type=float, default=0.40, help="IoU threshold")
     parser.add_argument("--imgsz", type=int, default=640, help="Inference image size")
     parser.add_argument("--device", default="", help="'cpu', 'cuda:0', etc.")
+    parser.add_argument("--half", action=argparse.BooleanOptionalAction, default=None,
+                        help="FP16 inference (default: on for GPU, off for CPU)")
+    parser.add_argument("--batch", type=int, default=None,
+                        help="Images per forward pass (default: 16 on GPU, 1 on CPU)")
     args = parser.parse_args()
 
     canton = args.canton.lower()
@@ -48,7 +52,11 @@ def main() -> None:
 
     # ---------------------- Device setup ---------------------
     device = args.device or ("cuda:0" if torch.cuda.is_available() else "cpu")
-    print(f"Using device: {device}")
+    # FP16 and batching defaults are for CUDA only ("cuda:0", or a bare index like "0")
+    on_gpu = str(device).startswith("cuda") or str(device).split(",")[0].isdigit()
+    half = on_gpu if args.half is None else args.half
+    batch = (16 if on_gpu else 1) if args.batch is None else args.batch
+    print(f"Using device: {device} (half={half}, batch={batch})")
 
     # ---------------------- Inference ------------------------
     print(f" Running inference on canton '{canton}'...")
@@ -58,6 +66,9 @@ def main() -> None:
     model = YOLO(model_path)
     if device != "cpu":
         model.to(device)
+    if on_gpu:
+        # All patches are the same size: let cuDNN pick the fastest kernels once
+        torch.backends.cudnn.benchmark = True
 
     model.predict(
         source=source_path,
@@ -65,6 +76,8 @@ def main() -> None:
         iou=args.iou,
         imgsz=args.imgsz,
         device=device,
+        half=half,
+        batch=batch,
         save=True,
         save_txt=True,
         save_conf=True,
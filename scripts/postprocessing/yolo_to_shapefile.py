@@ -1,11 +1,38 @@
 #!/usr/bin/env python3
 import argparse
+import os
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import geopandas as gpd
 import numpy as np
 import rasterio
+import shapely
 from shapely.geometry import box
+from shapely.strtree import STRtree
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# pyogrio writes whole columns through GDAL in C; fiona goes feature by feature
+try:
+    import pyogrio  # noqa: F401
+    WRITE_ENGINE = "pyogrio"
+except ImportError:
+    WRITE_ENGINE = "fiona"
+
+# Only used to build the GeoPackage spatial index after the bulk write
+try:
+    from osgeo import gdal
+    gdal.UseExceptions()
+except ImportError:
+    gdal = None
+
+# Shapely 2 STRtree.query takes a predicate and returns integer indices
+SHAPELY_2 = int(shapely.__version__.split('.')[0]) >= 2
 
 
 def yolo_to_pixel(cx, cy, w, h, width, height):
@@ -17,20 +44,107 @@ def yolo_to_pixel(cx, cy, w, h, width, height):
     return xmin, ymin, xmax, ymax
 
 
-def compute_iou_shapely(box1, box2):
-    """Compute IoU between two shapely box geometries."""
-    intersection = box1.intersection(box2).area
-    union = box1.union(box2).area
-    return intersection / union if union > 0 else 0.0
+def box_areas(bounds):
+    """Areas of axis-aligned boxes given as (..., 4) arrays of (minx, miny, maxx, maxy)."""
+    return (bounds[..., 2] - bounds[..., 0]) * (bounds[..., 3] - bounds[..., 1])
 
 
-def nms_geospatial(gdf, iou_threshold=0.5):
+def compute_iou_aabb(bounds1, bounds2, area1=None, area2=None):
+    """
+    Compute IoU between axis-aligned boxes given as (..., 4) arrays of (minx, miny, maxx, maxy).
+    Broadcasts, so one box can be compared against many.
+    Areas can be passed in when they were already computed for all boxes.
+    """
+    inter_w = np.maximum(0.0, np.minimum(bounds1[..., 2], bounds2[..., 2]) - np.maximum(bounds1[..., 0], bounds2[..., 0]))
+    inter_h = np.maximum(0.0, np.minimum(bounds1[..., 3], bounds2[..., 3]) - np.maximum(bounds1[..., 1], bounds2[..., 1]))
+    intersection = inter_w * inter_h
+    
+    if area1 is None:
+        area1 = box_areas(bounds1)
+    if area2 is None:
+        area2 = box_areas(bounds2)
+    union = area1 + area2 - intersection
+    
+    return intersection / np.where(union > 0, union, 1.0)
+
+
+def _nms_bruteforce_numpy(bounds, iou_threshold):
+    """Greedy NMS over score-sorted bounds, comparing each kept box to all later ones."""
+    areas = box_areas(bounds)
+    suppressed = np.zeros(len(bounds), dtype=bool)
+    for i in range(len(bounds)):
+        if suppressed[i]:
+            continue
+        rest = np.flatnonzero(~suppressed[i + 1:]) + i + 1
+        iou = compute_iou_aabb(bounds[i], bounds[rest], areas[i], areas[rest])
+        suppressed[rest[iou > iou_threshold]] = True
+    return ~suppressed
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _nms_bruteforce_numba(bounds, iou_threshold):
+        """Compiled greedy NMS over score-sorted bounds (same result as the NumPy version)."""
+        n = bounds.shape[0]
+        suppressed = np.zeros(n, dtype=np.bool_)
+        for i in range(n):
+            if suppressed[i]:
+                continue
+            area_i = (bounds[i, 2] - bounds[i, 0]) * (bounds[i, 3] - bounds[i, 1])
+            for j in range(i + 1, n):
+                if suppressed[j]:
+                    continue
+                inter_w = min(bounds[i, 2], bounds[j, 2]) - max(bounds[i, 0], bounds[j, 0])
+                if inter_w <= 0:
+                    continue
+                inter_h = min(bounds[i, 3], bounds[j, 3]) - max(bounds[i, 1], bounds[j, 1])
+                if inter_h <= 0:
+                    continue
+                intersection = inter_w * inter_h
+                area_j = (bounds[j, 2] - bounds[j, 0]) * (bounds[j, 3] - bounds[j, 1])
+                union = area_i + area_j - intersection
+                if union > 0 and intersection / union > iou_threshold:
+                    suppressed[j] = True
+        return ~suppressed
+
+
+def _nms_greedy_python(indptr, dst):
+    """Greedy pass over score-sorted boxes; dst[indptr[i]:indptr[i+1]] are the boxes i would suppress."""
+    n = len(indptr) - 1
+    suppressed = np.zeros(n, dtype=bool)
+    for i in range(n):
+        if suppressed[i]:
+            continue
+        suppressed[dst[indptr[i]:indptr[i + 1]]] = True
+    return ~suppressed
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _nms_greedy_numba(indptr, dst):
+        """Compiled greedy pass (same result as the Python version)."""
+        n = indptr.shape[0] - 1
+        suppressed = np.zeros(n, dtype=np.bool_)
+        for i in range(n):
+            if suppressed[i]:
+                continue
+            for k in range(indptr[i], indptr[i + 1]):
+                suppressed[dst[k]] = True
+        return ~suppressed
+
+
+_nms_greedy = _nms_greedy_numba if njit is not None else _nms_greedy_python
+
+
+def nms_geospatial(gdf, iou_threshold=0.5, bounds=None):
     """
     Apply NMS on a GeoDataFrame of detections.
     
     Args:
         gdf: GeoDataFrame with 'geometry' and 'score' columns
         iou_threshold: IoU threshold for duplicate removal
+        bounds: optional (N, 4) array of the geometries' (minx, miny, maxx, maxy),
+            row-aligned with gdf, when the caller already has it
     
     Returns:
         GeoDataFrame with duplicates removed
@@ -38,31 +152,196 @@ def nms_geospatial(gdf, iou_threshold=0.5):
     if len(gdf) == 0:
         return gdf
     
-    # Sort by score (descending)
-    gdf = gdf.sort_values('score', ascending=False).reset_index(drop=True)
+    # Work on a score-descending index order; the frame itself is only
+    # reindexed once, for the survivors
+    order = np.argsort(-gdf['score'].to_numpy(dtype=np.float64), kind='stable')
     
-    keep_indices = []
-    suppressed = set()
+    # Detections are axis-aligned boxes: IoU only needs their bounds.
+    # Kept in float64, LV95 coordinates are in the millions.
+    if bounds is None:
+        if SHAPELY_2:
+            bounds = shapely.bounds(np.asarray(gdf.geometry.values))
+        else:
+            bounds = gdf.geometry.bounds.to_numpy(dtype=np.float64)
+    bounds = np.ascontiguousarray(bounds[order], dtype=np.float64)
     
-    for i in range(len(gdf)):
-        if i in suppressed:
-            continue
-        
-        keep_indices.append(i)
-        box1 = gdf.geometry.iloc[i]
-        
-        # Suppress overlapping lower-confidence boxes
-        for j in range(i + 1, len(gdf)):
-            if j in suppressed:
+    if not SHAPELY_2:
+        # No index-returning STRtree: compare all pairs, compiled when numba is available
+        nms = _nms_bruteforce_numba if njit is not None else _nms_bruteforce_numpy
+        keep = nms(bounds, iou_threshold)
+        return gdf.iloc[order[keep]].reset_index(drop=True)
+    
+    geoms = np.asarray(gdf.geometry.values)[order]
+    tree = STRtree(geoms)
+    
+    # One bulk query for all touching pairs; only lower-confidence boxes (j > i) matter
+    src, dst = tree.query(geoms, predicate='intersects')
+    later = dst > src
+    src, dst = src[later], dst[later]
+    
+    # IoU does not depend on suppression order: score every pair at once
+    # and keep only the ones over the threshold, grouped by source box
+    areas = box_areas(bounds)
+    iou = compute_iou_aabb(bounds[src], bounds[dst], areas[src], areas[dst])
+    over = iou > iou_threshold
+    src, dst = src[over], dst[over]
+    by_src = np.argsort(src, kind='stable')
+    src, dst = src[by_src], dst[by_src]
+    indptr = np.searchsorted(src, np.arange(len(gdf) + 1))
+    
+    keep = _nms_greedy(indptr, dst)
+    return gdf.iloc[order[keep]].reset_index(drop=True)
+
+
+def iter_tifs(tif_dir, recursive):
+    """Yield .tif/.tiff paths in tif_dir (and subfolders if recursive) with one directory scan."""
+    if recursive:
+        walk = os.walk(tif_dir)
+    else:
+        with os.scandir(tif_dir) as it:
+            walk = [(tif_dir, [], [e.name for e in it if e.is_file()])]
+    for root, _, files in walk:
+        for name in files:
+            if name.endswith((".tif", ".tiff")):
+                yield Path(root) / name
+
+
+def build_label_index(labels_dir, recursive):
+    """
+    Scan labels_dir once and return (names, paths) of all .txt files, sorted by file name,
+    so label lookups per patch are a binary search instead of a glob.
+    """
+    if recursive:
+        walk = os.walk(labels_dir)
+    else:
+        with os.scandir(labels_dir) as it:
+            walk = [(labels_dir, [], [e.name for e in it if e.is_file()])]
+    entries = sorted(
+        (name, Path(root) / name)
+        for root, _, files in walk
+        for name in files
+        if name.endswith(".txt")
+    )
+    return [name for name, _ in entries], [path for _, path in entries]
+
+
+def find_label_files(label_index, stem):
+    """Label files whose name starts with the image stem (same match as glob(f"{stem}*.txt"))."""
+    names, paths = label_index
+    matches = []
+    k = bisect_left(names, stem)
+    while k < len(names) and names[k].startswith(stem):
+        matches.append(paths[k])
+        k += 1
+    return sorted(matches)
+
+
+def _parse_label_lines(label_path):
+    """Tolerant line-by-line parser: skips short or malformed lines."""
+    rows = []
+    with open(label_path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            parts = line.strip().split()
+            if len(parts) < 5:
+                continue
+            # YOLO normalized: class cx cy w h [score]
+            try:
+                rows.append((
+                    int(parts[0]), *map(float, parts[1:5]),
+                    float(parts[5]) if len(parts) >= 6 else np.nan,
+                ))
+            except Exception:
                 continue
-            
-            box2 = gdf.geometry.iloc[j]
-            iou = compute_iou_shapely(box1, box2)
-            
-            if iou > iou_threshold:
-                suppressed.add(j)
+    return rows
+
+
+def load_label_file(label_path):
+    """
+    Load a YOLO label file as an (N, 6) float64 array of class, cx, cy, w, h, score
+    (score is NaN when the file has none). Returns None if there are no detections.
+    """
+    if os.path.getsize(label_path) == 0:
+        return None
+    try:
+        # Fast path: well-formed files with a consistent column count parse in C.
+        # The class id goes through int() like in the line parser, so a float id
+        # such as "0.0" raises and the file falls back (where that line is skipped).
+        arr = np.loadtxt(label_path, dtype=np.float64, ndmin=2, converters={0: int})
+        if arr.shape[1] == 5:
+            arr = np.column_stack([arr, np.full(len(arr), np.nan)])
+        elif arr.shape[1] >= 6:
+            arr = arr[:, :6]
+        else:
+            arr = None
+        if arr is not None:
+            return arr if len(arr) else None
+    except ValueError:
+        pass
+    rows = _parse_label_lines(label_path)
+    return np.array(rows, dtype=np.float64) if rows else None
+
+
+def process_tif(tif, label_index, fallback_crs):
+    """
+    Convert all label files of one TIFF patch to map-coordinate boxes.
+    
+    Returns:
+        (crs, [(label_path, classes, scores, bounds), ...]), or None if the patch has no labels
+    """
+    # Match any label file that starts with the image stem (handles _0, _1, etc.)
+    label_files = find_label_files(label_index, tif.stem)
+
+    if not label_files:
+        return None
+
+    # Only the georeferencing is needed, no pixels are read
+    with rasterio.open(tif) as src:
+        width, height = src.width, src.height
+        transform = src.transform
+        crs = src.crs if src.crs else fallback_crs
+    a, b, c, d, e, f = transform.a, transform.b, transform.c, transform.d, transform.e, transform.f
+
+    per_file = []
+    for lf in label_files:
+        arr = load_label_file(lf)
+        if arr is None:
+            continue
+
+        # 1) YOLO → pixel bbox, for the whole file at once
+        xmin, ymin, xmax, ymax = yolo_to_pixel(arr[:, 1], arr[:, 2], arr[:, 3], arr[:, 4], width, height)
+
+        # 2) Pixel → map coords via affine (col=x, row=y), straight from the coefficients
+        x1 = a * xmin + b * ymin + c   # top-left
+        y1 = d * xmin + e * ymin + f
+        x2 = a * xmax + b * ymax + c   # bottom-right
+        y2 = d * xmax + e * ymax + f
+
+        # 3) Ensure proper ordering
+        bounds = np.column_stack([
+            np.minimum(x1, x2), np.minimum(y1, y2),
+            np.maximum(x1, x2), np.maximum(y1, y2),
+        ])
+        per_file.append((lf, arr[:, 0].astype(np.int64), arr[:, 5], bounds))
+
+    return crs, per_file
+
+
+def write_gpkg(gdf, out_path, layer):
+    """
+    Write a GeoPackage layer. With the GDAL bindings available, the R*Tree is not
+    maintained row by row during the write but built once afterwards.
+    """
+    if gdal is None:
+        gdf.to_file(out_path, driver="GPKG", layer=layer, engine=WRITE_ENGINE)
+        return
     
-    return gdf.iloc[keep_indices].reset_index(drop=True)
+    gdf.to_file(out_path, driver="GPKG", layer=layer, engine=WRITE_ENGINE, SPATIAL_INDEX="NO")
+    ds = gdal.OpenEx(str(out_path), gdal.OF_VECTOR | gdal.OF_UPDATE)
+    geom_col = ds.GetLayerByName(layer).GetGeometryColumn()
+    result = ds.ExecuteSQL(f"SELECT CreateSpatialIndex('{layer}', '{geom_col}')")
+    if result is not None:
+        ds.ReleaseResultSet(result)
+    ds = None  # close to flush
 
 
 def main():
@@ -75,70 +354,50 @@ def main():
     ap.add_argument("--recursive", action="store_true", help="Recurse into subfolders")
     ap.add_argument("--fallback_crs", default="EPSG:2056", help="CRS to use if a TIFF lacks CRS (default: EPSG:2056)")
     ap.add_argument("--nms_iou", type=float, default=0.0, help="IoU threshold for cross-patch NMS (0=disabled, 0.3-0.7 recommended)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count(), help="Threads reading patches and labels (default: CPU count)")
     args = ap.parse_args()
 
-    # Collect TIFFs
-    tif_glob = "**/*.tif" if args.recursive else "*.tif"
-    tiff_glob = "**/*.tiff" if args.recursive else "*.tiff"
-    tif_paths = sorted(list(Path(args.tif_dir).glob(tif_glob)) + list(Path(args.tif_dir).glob(tiff_glob)))
+    # Collect TIFFs, and index the labels once for all of them
+    tif_paths = sorted(iter_tifs(args.tif_dir, args.recursive))
+    label_index = build_label_index(args.labels_dir, args.recursive)
 
-    records, geoms = [], []
-    last_crs = None  # keep track of a valid CRS to attach to the GeoDataFrame
+    # Tiles are independent and I/O-bound (raster header + label reads): overlap them.
+    # map() keeps tile order, so the output is the same as a serial run.
+    with ThreadPoolExecutor(max_workers=args.workers) as ex:
+        results = list(ex.map(
+            lambda tif: process_tif(tif, label_index, args.fallback_crs),
+            tif_paths,
+        ))
 
-    for tif in tif_paths:
-        stem = tif.stem
-        # Match any label file that starts with the image stem (handles _0, _1, etc.)
-        label_pattern = f"{stem}*.txt"
-        if args.recursive:
-            label_files = sorted(Path(args.labels_dir).rglob(label_pattern))
-        else:
-            label_files = sorted(Path(args.labels_dir).glob(label_pattern))
-
-        if not label_files:
+    imgs, labels, classes, scores, bounds = [], [], [], [], []
+    last_crs = None  # keep track of a valid CRS to attach to the GeoDataFrame
+    for tif, result in zip(tif_paths, results):
+        if result is None:
             continue
+        last_crs, per_file = result
+        for lf, cls, score, b in per_file:
+            imgs += [tif.name] * len(b)
+            labels += [lf.name] * len(b)
+            classes.append(cls)
+            scores.append(score)
+            bounds.append(b)
 
-        with rasterio.open(tif) as src:
-            width, height = src.width, src.height
-            transform = src.transform
-            crs = src.crs if src.crs else args.fallback_crs
-            last_crs = crs
-
-            for lf in label_files:
-                with open(lf, "r", encoding="utf-8", errors="ignore") as f:
-                    for line in f:
-                        parts = line.strip().split()
-                        if len(parts) < 5:
-                            continue
-                        # YOLO normalized: class cx cy w h [score]
-                        try:
-                            cls = int(parts[0])
-                            cx, cy, w, h = map(float, parts[1:5])
-                            score = float(parts[5]) if len(parts) >= 6 else np.nan
-                        except Exception:
-                            continue
-
-                        # 1) YOLO → pixel bbox
-                        xmin, ymin, xmax, ymax = yolo_to_pixel(cx, cy, w, h, width, height)
-
-                        # 2) Pixel → map coords via affine (col=x, row=y)
-                        x1, y1 = transform * (xmin, ymin)   # top-left
-                        x2, y2 = transform * (xmax, ymax)   # bottom-right
-
-                        # 3) Ensure proper ordering
-                        minx, maxx = sorted([x1, x2])
-                        miny, maxy = sorted([y1, y2])
-
-                        geoms.append(box(minx, miny, maxx, maxy))
-                        records.append({
-                            "img": tif.name,
-                            "label": lf.name,
-                            "class": cls,
-                            "score": score,
-                        })
-
-    if not geoms:
+    if not bounds:
         raise SystemExit("No detections found! (Check filename matching and that labels are YOLO-normalized)")
 
+    bounds = np.concatenate(bounds)
+    if SHAPELY_2:
+        # Vectorized constructor: all polygons in one call
+        geoms = shapely.box(bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3])
+    else:
+        geoms = [box(*b) for b in bounds]
+    records = {
+        "img": imgs,
+        "label": labels,
+        "class": np.concatenate(classes),
+        "score": np.concatenate(scores),
+    }
+
     # Build GeoDataFrame
     gdf = gpd.GeoDataFrame(records, geometry=geoms, crs=last_crs or args.fallback_crs)
     
@@ -146,18 +405,18 @@ def main():
     
     # Apply cross-patch NMS if requested
     if args.nms_iou > 0:
-        gdf = nms_geospatial(gdf, iou_threshold=args.nms_iou)
+        gdf = nms_geospatial(gdf, iou_threshold=args.nms_iou, bounds=bounds)
         print(f"✂️  Detections after NMS (IoU={args.nms_iou}): {len(gdf)}")
-        print(f"🗑️  Removed duplicates: {len(geoms) - len(gdf)}")
+        print(f"🗑️  Removed duplicates: {len(bounds) - len(gdf)}")
 
     out_path = Path(args.out)
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
     # Write (support .gpkg too—nice in QGIS)
     if out_path.suffix.lower() == ".gpkg":
-        gdf.to_file(out_path, driver="GPKG", layer="detections")
+        write_gpkg(gdf, out_path, layer="detections")
     else:
-        gdf.to_file(out_path, driver="ESRI Shapefile")
+        gdf.to_file(out_path, driver="ESRI Shapefile", engine=WRITE_ENGINE)
 
     print(f"✅ Wrote {len(gdf)} boxes to {out_path}")
     print(f"CRS: {gdf.crs}")
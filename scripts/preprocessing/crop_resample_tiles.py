@@ -1,18 +1,44 @@
 #!/usr/bin/env python3
 """
 Crop GeoTIFF tiles into smaller patches with uniform naming based on geographic coordinates.
-Uses subprocess to call gdalinfo instead of importing osgeo.
+Tile metadata and crops go through the GDAL Python bindings (in-process) when
+they are installed, and fall back to the gdalinfo / gdal_translate command-line
+tools otherwise.
 """
 
 import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import subprocess
 import json
 import sys
 
-def get_tile_bounds(tif_path):
-    """Extract geographic bounds from GeoTIFF using gdalinfo."""
+try:
+    from osgeo import gdal
+    gdal.UseExceptions()
+except ImportError:
+    gdal = None
+
+def get_tile_info(tif_path):
+    """
+    Read geographic bounds and raster dimensions of a GeoTIFF in one go.
+    Returns ((x_min, y_min, x_max, y_max), (width, height)), or None on error.
+    """
     try:
+        if gdal is not None:
+            # Header only, in-process
+            ds = gdal.Open(str(tif_path))
+            gt = ds.GetGeoTransform()
+            width, height = ds.RasterXSize, ds.RasterYSize
+            ds = None
+            
+            x_min = gt[0]
+            y_max = gt[3]
+            x_max = x_min + width * gt[1]
+            y_min = y_max + height * gt[5]
+            return (x_min, y_min, x_max, y_max), (width, height)
+        
         cmd = f'gdalinfo -json "{tif_path}"'
         result = subprocess.run(cmd, shell=True, capture_output=True, text=True, check=True)
         info = json.loads(result.stdout)
@@ -24,24 +50,12 @@ def get_tile_bounds(tif_path):
         x_max = coords['upperRight'][0]
         y_max = coords['upperRight'][1]
         
-        return (x_min, y_min, x_max, y_max)
-    except Exception as e:
-        print(f"⚠️ Error reading {tif_path}: {e}")
-        return None
-
-def get_tile_size(tif_path):
-    """Get raster dimensions using gdalinfo."""
-    try:
-        cmd = f'gdalinfo -json "{tif_path}"'
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True, check=True)
-        info = json.loads(result.stdout)
-        
         width = info['size'][0]
         height = info['size'][1]
         
-        return (width, height)
+        return (x_min, y_min, x_max, y_max), (width, height)
     except Exception as e:
-        print(f"⚠️ Error reading size of {tif_path}: {e}")
+        print(f"⚠️ Error reading {tif_path}: {e}")
         return None
 
 def run_cmd(cmd: str, quiet: bool):
@@ -56,6 +70,41 @@ def run_cmd(cmd: str, quiet: bool):
         print(f"⚠️ Error while executing:\n{cmd}\n{e}")
         return False
 
+def crop_windows(tif_path, windows, src_tile_size, tilesize, quiet):
+    """
+    Cut all windows of one source tile in-process: the source is opened once and
+    no gdal_translate process is spawned per patch.
+    windows is a list of (out_path, x_offset, y_offset). Returns the number of patches written.
+    """
+    # Same pixel size in and out: a plain window copy, no resampling kernel
+    resize = src_tile_size != tilesize
+    created = 0
+    try:
+        ds = gdal.Open(str(tif_path))
+    except RuntimeError as e:
+        print(f"⚠️ Error opening {tif_path}: {e}")
+        return 0
+    
+    for out_path, x_offset, y_offset in windows:
+        options = gdal.TranslateOptions(
+            format="GTiff",
+            srcWin=[x_offset, y_offset, src_tile_size, src_tile_size],
+            width=tilesize if resize else 0, height=tilesize if resize else 0,
+            resampleAlg="cubic" if resize else "nearest",
+            creationOptions=["COMPRESS=LZW", "TILED=YES"],
+        )
+        try:
+            out = gdal.Translate(str(out_path), ds, options=options)
+            out = None  # close to flush to disk
+            created += 1
+        except RuntimeError as e:
+            print(f"⚠️ Error while cropping {out_path.name} from {tif_path.name}: {e}")
+    
+    ds = None
+    if not quiet:
+        print(f"   {tif_path.name}: {created} patches")
+    return created
+
 def main():
     parser = argparse.ArgumentParser(description="Crop GeoTIFF tiles into smaller patches with uniform naming.")
     parser.add_argument("--src", required=True, help="Source folder with .tif files.")
@@ -65,6 +114,7 @@ def main():
     parser.add_argument("--tilesize", type=int, default=640, help="Tile size in pixels after resampling.")
     parser.add_argument("--overlap", type=int, default=210, help="Overlap in pixels between tiles.")
     parser.add_argument("--quiet", action="store_true", help="Suppress progress and print output.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Parallel crop workers (threads; each runs gdal.Translate in-process or a gdal_translate process; default: CPU count).")
     args = parser.parse_args()
 
     src_dir = Path(args.src)
@@ -92,22 +142,18 @@ def main():
         print(f"❌ No .tif files found in {src_dir}")
         sys.exit(1)
 
-    total_created = 0
     total_skipped = 0
+    windows_per_source = []
+    planned = set()  # outputs already queued, so two jobs never write the same file
 
     for tif_path in tif_files:
-        bounds = get_tile_bounds(tif_path)
-        if bounds is None:
-            print(f"⚠️ Skipping {tif_path.name} (could not read bounds)")
+        tile_info = get_tile_info(tif_path)
+        if tile_info is None:
+            print(f"⚠️ Skipping {tif_path.name} (could not read bounds/size)")
             continue
         
-        size = get_tile_size(tif_path)
-        if size is None:
-            print(f"⚠️ Skipping {tif_path.name} (could not read size)")
-            continue
-        
-        x_min, y_min, x_max, y_max = bounds
-        src_width, src_height = size
+        (x_min, y_min, x_max, y_max), (src_width, src_height) = tile_info
+        windows = []
 
         # Calculate how many tiles fit in this source image
         idx_i = 0
@@ -130,29 +176,48 @@ def main():
                 out_name = f"{grid_x}_{grid_y}_{idx_i}_{idx_j}.tif"
                 out_path = out_dir / out_name
 
-                if out_path.exists():
+                if out_path.exists() or out_path in planned:
                     total_skipped += 1
                     idx_j += 1
                     x_offset += src_stride
                     continue
 
-                # Use gdal_translate with source pixel coordinates
-                cmd = (
-                    f"gdal_translate {'-q ' if args.quiet else ''}-of GTiff "
-                    f"-srcwin {x_offset} {y_offset} {src_tile_size} {src_tile_size} "
-                    f"-outsize {args.tilesize} {args.tilesize} "
-                    f"-r cubic -co COMPRESS=LZW -co TILED=YES "
-                    f'"{tif_path}" "{out_path}"'
-                )
-                
-                if run_cmd(cmd, args.quiet):
-                    total_created += 1
+                # Window in source pixel coordinates
+                windows.append((out_path, x_offset, y_offset))
+                planned.add(out_path)
                 
                 idx_j += 1
                 x_offset += src_stride
             
             idx_i += 1
             y_offset += src_stride
+        
+        if windows:
+            windows_per_source.append((tif_path, windows))
+
+    with ThreadPoolExecutor(max_workers=args.workers) as ex:
+        if gdal is not None:
+            # One task per source tile: each thread owns its dataset handle
+            total_created = sum(ex.map(
+                lambda job: crop_windows(job[0], job[1], src_tile_size, args.tilesize, args.quiet),
+                windows_per_source,
+            ))
+        else:
+            # Use gdal_translate with source pixel coordinates.
+            # Each call is an independent process: the threads only wait on them
+            if src_tile_size != args.tilesize:
+                resample = f"-outsize {args.tilesize} {args.tilesize} -r cubic "
+            else:
+                resample = "-r nearest "  # same pixel size: plain window copy
+            cmds = [
+                f"gdal_translate {'-q ' if args.quiet else ''}-of GTiff "
+                f"-srcwin {x_offset} {y_offset} {src_tile_size} {src_tile_size} "
+                f"{resample}-co COMPRESS=LZW -co TILED=YES "
+                f'"{tif_path}" "{out_path}"'
+                for tif_path, windows in windows_per_source
+                for out_path, x_offset, y_offset in windows
+            ]
+            total_created = sum(ex.map(lambda cmd: run_cmd(cmd, args.quiet), cmds))
 
     if not args.quiet:
         print(f"✅ Cropping complete!")
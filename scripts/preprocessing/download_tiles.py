@@ -5,12 +5,27 @@ or from a plain text file of URLs.
 Works with or without headers.
 """
 
-import argparse, csv, os, re, time
+import argparse, csv, os, re, shutil, time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlparse
 from tqdm import tqdm
 
+# Tiles are large: copy the body in 8 MiB blocks
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# One pooled session for all downloads: connections (and TLS handshakes) are reused.
+# Retries are left to download(), which also covers failures in the middle of a body.
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
+# A URL never contains whitespace, so it always sits inside a single CSV cell
+URL_RE = re.compile(r"https?://\S+")
+
 # -----------------------------
 # Helpers
 # -----------------------------
@@ -20,8 +35,8 @@ def sanitize(name: str) -> str:
 
 def extract_urls_from_csv(csv_path):
     """Try to extract (name, url) pairs from CSV — works even without headers."""
-    rows = []
-    http_re = re.compile(r"https?://\S+")
+    # url -> name, deduplicated while reading (first position, last name wins)
+    uniq = {}
     with open(csv_path, "r", encoding="utf-8-sig", errors="ignore") as f:
         sample = f.read(4096)
         f.seek(0)
@@ -33,46 +48,72 @@ def extract_urls_from_csv(csv_path):
             f.seek(0)
             reader = csv.reader(f, delimiter=";")
 
+        # url/name columns are found on the first matching row and reused,
+        # so the full per-row scan only happens when the layout changes
+        url_col = name_col = None
         for line in reader:
-            joined = " ".join(line)
-            m = http_re.search(joined)
+            m = None
+            if url_col is not None and url_col < len(line):
+                m = URL_RE.search(line[url_col])
+            if not m:
+                url_col = None
+                for i, token in enumerate(line):
+                    # cheap substring test first; most cells are not URLs
+                    if "http" in token:
+                        m = URL_RE.search(token)
+                        if m:
+                            url_col = i
+                            break
             if not m:
                 continue
             url = m.group(0).strip().replace("\\", "")
             # try to extract a name (if any token looks like a .tif filename)
             name = None
-            for token in line:
-                if token.lower().endswith(".tif"):
-                    name = Path(token.strip()).name
-                    break
+            if name_col is not None and name_col < len(line) and line[name_col].lower().endswith(".tif"):
+                name = Path(line[name_col].strip()).name
+            else:
+                for i, token in enumerate(line):
+                    if token.lower().endswith(".tif"):
+                        name = Path(token.strip()).name
+                        name_col = i
+                        break
             if not name:
                 name = Path(urlparse(url).path).name
-            rows.append((name, url))
-    # remove duplicates
-    uniq = {}
-    for n, u in rows:
-        uniq[u] = n
-    return [(v, k) for k, v in uniq.items()]
+            uniq[url] = name
+    return [(name, url) for url, name in uniq.items()]
 
-def download(url: str, out_path: Path, retries=3, timeout=120):
-    """Stream download with progress bar and retry"""
+def download(url: str, out_path: Path, retries=3, timeout=120, progress=True, refresh=False):
+    """
+    Stream download with (optional) progress bar and retry.
+    With refresh, an existing file is re-checked against the server's ETag
+    (conditional GET) and only downloaded again if it changed.
+    """
     out_path.parent.mkdir(parents=True, exist_ok=True)
+    etag_path = out_path.with_name(out_path.name + ".etag")
+    headers = {}
     if out_path.exists() and out_path.stat().st_size > 0:
-        return "skip"
+        if not (refresh and etag_path.exists()):
+            return "skip"
+        headers["If-None-Match"] = etag_path.read_text().strip()
     for attempt in range(1, retries + 1):
         try:
-            with requests.get(url, stream=True, timeout=timeout) as r:
+            with SESSION.get(url, stream=True, timeout=timeout, headers=headers) as r:
+                if r.status_code == 304:
+                    return "skip"
                 r.raise_for_status()
                 total = int(r.headers.get("content-length", 0))
-                with open(out_path, "wb") as f, tqdm(
-                    total=total, unit="B", unit_scale=True, leave=False, desc=out_path.name
-                ) as pbar:
-                    for chunk in r.iter_content(chunk_size=1024 * 1024):
-                        if chunk:
-                            f.write(chunk)
-                            pbar.update(len(chunk))
+                # Raw socket → file in large blocks; the bar counts bytes written
+                r.raw.decode_content = True
+                with open(out_path, "wb") as f, tqdm.wrapattr(
+                    f, "write", total=total, unit="B", unit_scale=True, leave=False, desc=out_path.name,
+                    disable=not progress
+                ) as fw:
+                    shutil.copyfileobj(r.raw, fw, length=CHUNK_SIZE)
+                etag = r.headers.get("ETag")
             if out_path.stat().st_size == 0:
                 raise IOError("Empty file after download")
+            if etag:
+                etag_path.write_text(etag)
             return "ok"
         except Exception as e:
             if attempt == retries:
@@ -88,6 +129,8 @@ def main():
     ap.add_argument("--out", required=True, help="Output folder, e.g., data/raw/canton_ticino/swissimage")
     ap.add_argument("--max", type=int, default=0, help="Max number of files to download (0=all)")
     ap.add_argument("--prefix", default="", help="Optional filename prefix, e.g., ticino_")
+    ap.add_argument("--workers", type=int, default=16, help="Concurrent downloads (default: 16)")
+    ap.add_argument("--refresh", action="store_true", help="Re-check existing files against the server ETag and re-download changed ones")
     args = ap.parse_args()
 
     out_dir = Path(args.out)
@@ -100,11 +143,31 @@ def main():
     if args.max > 0:
         rows = rows[:args.max]
 
-    log = []
-    for name, url in tqdm(rows, desc="Downloading tiles", unit="file"):
-        fname = args.prefix + sanitize(Path(name).stem) + ".tif"
-        status = download(url, out_dir / fname)
-        log.append((fname, url, status))
+    fnames = [args.prefix + sanitize(Path(name).stem) + ".tif" for name, _ in rows]
+    workers = max(args.workers, 1)
+
+    def fetch(job):
+        fname, url = job
+        # Per-file byte bars only make sense when downloading one file at a time
+        return download(url, out_dir / fname, progress=workers == 1, refresh=args.refresh)
+
+    # Different URLs can sanitize to the same file name: only the first one is
+    # downloaded (as in a sequential run, where the later ones found the file and skipped),
+    # so two threads never write the same file
+    jobs = [(fname, url) for fname, (_, url) in zip(fnames, rows)]
+    first = {}
+    for i, (fname, _) in enumerate(jobs):
+        first.setdefault(fname, i)
+    unique = sorted(first.values())
+
+    # Network-bound: keep several requests in flight (results stay in input order)
+    statuses = ["skip"] * len(jobs)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        results = ex.map(fetch, [jobs[i] for i in unique])
+        for i, status in zip(unique, tqdm(results, total=len(unique), desc="Downloading tiles", unit="file")):
+            statuses[i] = status
+
+    log = [(fname, url, status) for (fname, url), status in zip(jobs, statuses)]
 
     # Save manifest
     manifest = out_dir / "manifest.csv"
@@ -9,12 +9,19 @@ Steps:
 4. Crop/resample SWISSIMAGE and hillshades to 640x640 @ 0.5 m
 5. Fuse RGB + Hillshade patches
 
+The SWISSIMAGE and DSM/hillshade branches run concurrently; fusion waits for both.
+
 Usage:
 python scripts/preprocessing/run_preprocessing_for_canton.py --canton valais
 """
 
 import argparse
+import os
+import re
+import signal
 import subprocess
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 from pathlib import Path
 import sys
 
@@ -23,19 +30,92 @@ ROOT = Path(__file__).resolve()
 while ROOT.name not in ("switzerland_nationwide_rock_detection", "") and not (ROOT / "data").exists():
     ROOT = ROOT.parent
 
-def run(cmd, quiet=False):
-    """Run shell command with clear logging."""
-    print(f"\n {cmd}")
+# Commands currently running in the branch threads, and a flag set once one step failed
+_PROCS = set()
+_PROCS_LOCK = threading.Lock()
+_ABORT = threading.Event()
+_OUT_LOCK = threading.Lock()
+
+# Line and carriage-return boundaries (tqdm and GDAL redraw progress with \r)
+_SEGMENT_RE = re.compile(rb"([\r\n])")
+
+def _relay(stream, prefix):
+    """
+    Copy a child's output to stdout as it arrives, with prefix at the start of every
+    \n- or \r-terminated segment, so progress redraws stay live and labelled.
+    """
+    at_start = True
+    while True:
+        chunk = stream.read1(65536)
+        if not chunk:
+            break
+        parts = []
+        for piece in _SEGMENT_RE.split(chunk):
+            if not piece:
+                continue
+            if piece in (b"\r", b"\n"):
+                parts.append(piece)
+                at_start = True
+            else:
+                if at_start:
+                    parts.append(prefix)
+                parts.append(piece)
+                at_start = False
+        with _OUT_LOCK:
+            sys.stdout.buffer.write(b"".join(parts))
+            sys.stdout.buffer.flush()
+
+def run(cmd, quiet=False, tag=""):
+    """
+    Run shell command with clear logging.
+    With a tag, the command's output is relayed with the tag in front of every
+    line and progress redraw, so that concurrent branches stay readable.
+    """
+    if _ABORT.is_set():
+        sys.exit(1)
+    prefix = f"[{tag}] " if tag else ""
+    print(f"\n{prefix or ' '}{cmd}", flush=True)
+    
+    env = None
+    if quiet:
+        out, err = subprocess.DEVNULL, subprocess.DEVNULL
+    elif tag:
+        out, err = subprocess.PIPE, subprocess.STDOUT
+        # Python children would block-buffer print() into a pipe
+        env = {**os.environ, "PYTHONUNBUFFERED": "1"}
+    else:
+        out, err = None, None
+    # Own process group, so a failing branch can stop the other one's command tree
+    proc = subprocess.Popen(cmd, shell=True, stdout=out, stderr=err, env=env, start_new_session=True)
+    with _PROCS_LOCK:
+        _PROCS.add(proc)
+        if _ABORT.is_set():  # started while another branch was being aborted
+            os.killpg(proc.pid, signal.SIGTERM)
     try:
-        if quiet:
-            subprocess.run(cmd, shell=True, check=True,
-                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        else:
-            subprocess.run(cmd, shell=True, check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error while running:\n{cmd}\n{e}")
+        if out is subprocess.PIPE:
+            sys.stdout.flush()
+            _relay(proc.stdout, prefix.encode())
+        proc.wait()
+    finally:
+        with _PROCS_LOCK:
+            _PROCS.discard(proc)
+    
+    if proc.returncode != 0:
+        if not _ABORT.is_set():
+            e = subprocess.CalledProcessError(proc.returncode, cmd)
+            print(f"Error while running:\n{prefix}{cmd}\n{e}", flush=True)
         sys.exit(1)
 
+def abort_running():
+    """Stop the commands still running in other branches after a failure."""
+    _ABORT.set()
+    with _PROCS_LOCK:
+        for proc in _PROCS:
+            try:
+                os.killpg(proc.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
 def main():
     parser = argparse.ArgumentParser(description="Run full preprocessing pipeline for a given canton.")
     parser.add_argument("--canton", required=True, help="Canton name, e.g. valais, geneva, bern")
@@ -76,27 +156,40 @@ def main():
     tiles_hs = tiles_dir / "hillshade_patches"
     fused_dir = processed_dir / "images_hs_fusion"
 
-    # ---- 1. Download SWISSIMAGE ----
-    run(f"python scripts/preprocessing/download_tiles.py "
-        f"--csv {swissimage_csv} --out {raw_si}", quiet)
-
-    # ---- 2. Download DSM ----
-    run(f"python scripts/preprocessing/download_tiles.py "
-        f"--csv {dsm_csv} --out {raw_dsm}", quiet)
-
-    # ---- 3. Generate hillshade ----
-    run(f"python scripts/preprocessing/generate_hillshade.py "
-        f"--src {raw_dsm} --out {raw_hs} --az 315 --alt 45", quiet)
-
-    # ---- 4. Crop & resample SWISSIMAGE (0.1 -> 0.5 m) ----
-    run(f"python scripts/preprocessing/crop_resample_tiles.py "
-        f"--src {raw_si} --out {tiles_si} --src_res 0.1 --dst_res 0.5 "
-        f"--tilesize 640 --overlap 210 --quiet", quiet)
-
-    # ---- 5. Crop hillshade (already 0.5 m) ----
-    run(f"python scripts/preprocessing/crop_resample_tiles.py "
-        f"--src {raw_hs} --out {tiles_hs} --src_res 0.5 --dst_res 0.5 "
-        f"--tilesize 640 --overlap 210 --quiet", quiet)
+    # SWISSIMAGE (steps 1, 4) and DSM (steps 2, 3, 5) are independent branches:
+    # run them side by side so one branch's downloads overlap the other's processing
+    def swissimage_branch():
+        # ---- 1. Download SWISSIMAGE ----
+        run(f"python scripts/preprocessing/download_tiles.py "
+            f"--csv {swissimage_csv} --out {raw_si}", quiet, tag="swissimage")
+
+        # ---- 4. Crop & resample SWISSIMAGE (0.1 -> 0.5 m) ----
+        run(f"python scripts/preprocessing/crop_resample_tiles.py "
+            f"--src {raw_si} --out {tiles_si} --src_res 0.1 --dst_res 0.5 "
+            f"--tilesize 640 --overlap 210 --quiet", quiet, tag="swissimage")
+
+    def dsm_branch():
+        # ---- 2. Download DSM ----
+        run(f"python scripts/preprocessing/download_tiles.py "
+            f"--csv {dsm_csv} --out {raw_dsm}", quiet, tag="dsm")
+
+        # ---- 3. Generate hillshade ----
+        run(f"python scripts/preprocessing/generate_hillshade.py "
+            f"--src {raw_dsm} --out {raw_hs} --az 315 --alt 45", quiet, tag="dsm")
+
+        # ---- 5. Crop hillshade (already 0.5 m) ----
+        run(f"python scripts/preprocessing/crop_resample_tiles.py "
+            f"--src {raw_hs} --out {tiles_hs} --src_res 0.5 --dst_res 0.5 "
+            f"--tilesize 640 --overlap 210 --quiet", quiet, tag="dsm")
+
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        branches = [ex.submit(swissimage_branch), ex.submit(dsm_branch)]
+        # Stop as soon as either branch fails instead of waiting for the other one
+        done, _ = wait(branches, return_when=FIRST_EXCEPTION)
+        if any(branch.exception() is not None for branch in done):
+            abort_running()
+            print("Preprocessing aborted: a step failed (see error above).")
+            sys.exit(1)
 
     # ---- 6. Fuse RGB + Hillshade ----
     run(f"python scripts/preprocessing/fuse_rgb_hs.py "